@@ -527,8 +527,46 @@ def generate_conducting_software_html(filename="bell_conducting_software.html"):
                 }}
             }}
 
+            // Expands a columnar timeline (see ColumnarTimeline in bell_ringing_calculator.py)
+            // into the list of ring events; a list of events is returned unchanged.
+            function expandTimeline(timeline) {{
+                if (Array.isArray(timeline)) {{
+                    return timeline;
+                }}
+                const events = [];
+                if (timeline.encoding === 'rows') {{
+                    let absoluteTimeStart = 0;
+                    let strike = 0;
+                    timeline.row_lengths.forEach((rowLength, rowIndex) => {{
+                        const interval = timeline.row_intervals[rowIndex];
+                        for (let position = 1; position <= rowLength; position++) {{
+                            events.push({{
+                                row: rowIndex + 1,
+                                ringer: timeline.ringer[strike++],
+                                position_in_row: position,
+                                time_between_rings_in_row: interval,
+                                absolute_time_start: absoluteTimeStart
+                            }});
+                            absoluteTimeStart += interval;
+                        }}
+                    }});
+                }} else {{
+                    for (let i = 0; i < timeline.row.length; i++) {{
+                        events.push({{
+                            row: timeline.row[i],
+                            ringer: timeline.ringer[i],
+                            position_in_row: timeline.position_in_row[i],
+                            time_between_rings_in_row: timeline.time_between_rings_in_row[i],
+                            absolute_time_start: timeline.absolute_time_start[i]
+                        }});
+                    }}
+                }}
+                return events;
+            }}
+
             function loadScore(data) {{
                 resetPlaybackState();
+                data.timeline = expandTimeline(data.timeline);
                 currentScoreData = data;
                 // Create a *copy* of the timeline events to modify with offsets
                 timelineEvents = JSON.parse(JSON.stringify(data.timeline));
@@ -1,8 +1,21 @@
 import librosa
 import numpy as np
 from scipy.signal import find_peaks
+from scipy import fft as scipy_fft
 import json
 import argparse # Ensure argparse is imported if not already
+import contextlib
+import functools
+import glob
+import hashlib
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 
 def freq_to_midi(freq):
@@ -51,8 +64,1181 @@ def constrain_midi_to_octave(midi_note, target_octave_midi_start=60):
     # C4 or D4 or E4 etc., without wrapping above B4 to C4 again, you'd clamp the range.
     # But "constrain to a single octave" usually implies wrapping.
 
+# WAVE format tags that can be mapped straight to a numpy dtype.
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+WAV_SAMPLE_DTYPES = {(WAVE_FORMAT_PCM, 16): '<i2', (WAVE_FORMAT_PCM, 32): '<i4', (WAVE_FORMAT_IEEE_FLOAT, 32): '<f4'}
+
+# Containers soundfile cannot read, decoded through an ffmpeg pipe instead.
+FFMPEG_CONTAINER_EXTENSIONS = (".m4a", ".mp4", ".aac")
+
+
+def map_wav_samples(audio_path):
+    """
+    Memory-maps the sample data of an uncompressed 16/32-bit PCM or 32-bit float WAV.
+
+    Args:
+        audio_path (str): Path to the file.
+    Returns:
+        tuple: (sample_rate, read-only (n_samples, channels) np.memmap in the file's
+               own dtype), or None if the file is not a WAV this can map.
+    """
+    try:
+        with open(audio_path, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                return None
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack('<4sI', header)
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    format_tag, channels, sr = struct.unpack('<HHI', fmt[:8])
+                    bits = struct.unpack('<H', fmt[14:16])[0]
+                    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        # The real format tag is the first two bytes of the SubFormat GUID.
+                        format_tag = struct.unpack('<H', fmt[24:26])[0]
+                elif chunk_id == b'data' and fmt is not None:
+                    dtype = WAV_SAMPLE_DTYPES.get((format_tag, bits))
+                    if dtype is None:
+                        return None
+                    frame_bytes = channels * np.dtype(dtype).itemsize
+                    n_samples = min(chunk_size, os.path.getsize(audio_path) - f.tell()) // frame_bytes
+                    if n_samples == 0:
+                        return sr, np.zeros((0, channels), dtype=dtype)
+                    return sr, np.memmap(f, dtype=dtype, mode='r', offset=f.tell(), shape=(n_samples, channels))
+                else:
+                    # Chunks are word aligned.
+                    f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def wav_samples_to_mono(samples):
+    """
+    Converts a slice of WAV samples to mono float32 in [-1, 1), scaling integer
+    PCM like soundfile does. Float mono data is returned without a copy, as a
+    plain ndarray view: soxr's resampler rejects np.memmap input.
+    """
+    if samples.dtype == np.float32:
+        return np.asarray(samples[:, 0]) if samples.shape[1] == 1 else samples.mean(axis=1, dtype=np.float32)
+    scale = np.float32(1.0 / (1 << (8 * samples.dtype.itemsize - 1)))
+    if samples.shape[1] == 1:
+        # int32 * float32 promotes to float64; the product is exact there, so round once at the end.
+        return np.asarray(samples[:, 0] * scale, dtype=np.float32)
+    return samples.mean(axis=1, dtype=np.float32) * scale
+
+
+def ffprobe_sample_rate(audio_path):
+    """Returns the sample rate of the first audio stream reported by ffprobe."""
+    result = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries",
+                             "stream=sample_rate", "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+                            capture_output=True, text=True, check=True)
+    return int(result.stdout.split()[0])
+
+
+def open_ffmpeg_pipe(audio_path):
+    """Starts ffmpeg decoding audio_path to mono float32 PCM at its native rate on stdout."""
+    return subprocess.Popen(["ffmpeg", "-v", "error", "-i", audio_path, "-vn", "-ac", "1", "-f", "f32le", "-"],
+                            stdout=subprocess.PIPE)
+
+
+def load_audio(audio_path):
+    """
+    Decodes a whole file to mono float32 at its native sample rate.
+
+    Uncompressed WAV (what the server records) is memory-mapped and converted
+    in one step, or used as-is when it is already mono float32; m4a/mp4 are
+    decoded by an ffmpeg pipe. Everything else, and anything these paths
+    cannot handle, goes through librosa.load.
+
+    Returns:
+        tuple: (y, sr)
+    """
+    mapped = map_wav_samples(audio_path)
+    if mapped is not None:
+        sr, samples = mapped
+        return wav_samples_to_mono(samples), sr
+
+    if audio_path.lower().endswith(FFMPEG_CONTAINER_EXTENSIONS):
+        try:
+            sr = ffprobe_sample_rate(audio_path)
+            process = open_ffmpeg_pipe(audio_path)
+            data = process.stdout.read()
+            process.stdout.close()
+            if process.wait() == 0:
+                return np.frombuffer(data, dtype='<f4'), sr
+        except (OSError, subprocess.CalledProcessError, ValueError, IndexError):
+            pass
+
+    return librosa.load(audio_path, sr=None)
+
+
+def load_audio_channels(audio_path):
+    """
+    Decodes a whole file at its native sample rate without downmixing.
+
+    Uncompressed WAV is memory-mapped like in load_audio(); other files go
+    through librosa.load(mono=False).
+
+    Returns:
+        tuple: (y, sr) with y a float32 (n_channels, n_samples) array, one row
+               per channel (a single row for mono files).
+    """
+    mapped = map_wav_samples(audio_path)
+    if mapped is not None:
+        sr, samples = mapped
+        if samples.dtype == np.float32:
+            return np.ascontiguousarray(samples.T), sr
+        scale = np.float32(1.0 / (1 << (8 * samples.dtype.itemsize - 1)))
+        # Scaling by a power of two is exact, so converting first rounds each sample only once.
+        y = samples.T.astype(np.float32, order='C')
+        y *= scale
+        return y, sr
+    y, sr = librosa.load(audio_path, sr=None, mono=False)
+    return np.atleast_2d(y), sr
+
+
+def open_native_blocks(audio_path, block_length):
+    """
+    Picks the cheapest block reader for audio_path at its native sample rate.
+
+    Uncompressed WAV is memory-mapped, m4a/mp4 is piped through ffmpeg, other
+    files are decoded with soundfile when it can read the container and with
+    audioread (ffmpeg) otherwise. Every reader downmixes to mono float32.
+
+    Returns:
+        tuple: (native_sample_rate, function returning a generator of blocks)
+    """
+    mapped = map_wav_samples(audio_path)
+    if mapped is not None:
+        native_sr, samples = mapped
+
+        def read_wav_blocks():
+            for start in range(0, len(samples), block_length):
+                yield wav_samples_to_mono(samples[start:start + block_length])
+        return native_sr, read_wav_blocks
+
+    if audio_path.lower().endswith(FFMPEG_CONTAINER_EXTENSIONS):
+        try:
+            native_sr = ffprobe_sample_rate(audio_path)
+        except (OSError, subprocess.CalledProcessError, ValueError, IndexError):
+            native_sr = None
+        if native_sr:
+            def read_ffmpeg_blocks():
+                process = open_ffmpeg_pipe(audio_path)
+                try:
+                    while True:
+                        data = process.stdout.read(block_length * 4)
+                        if not data:
+                            break
+                        # A pipe read can end mid-sample; ffmpeg always writes whole samples in total.
+                        while len(data) % 4:
+                            rest = process.stdout.read(4 - len(data) % 4)
+                            if not rest:
+                                # Output cut off mid-sample: drop the partial sample.
+                                data = data[:len(data) - len(data) % 4]
+                                break
+                            data += rest
+                        yield np.frombuffer(data, dtype='<f4')
+                finally:
+                    process.stdout.close()
+                    process.wait()
+            return native_sr, read_ffmpeg_blocks
+
+    try:
+        import soundfile as sf
+        native_sr = sf.info(audio_path).samplerate
+
+        def read_soundfile_blocks():
+            with sf.SoundFile(audio_path) as f:
+                for block in f.blocks(blocksize=block_length, dtype='float32', always_2d=True):
+                    yield block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else block[:, 0]
+        return native_sr, read_soundfile_blocks
+    except Exception:
+        import audioread
+        reader = audioread.audio_open(audio_path)
+
+        def read_audioread_blocks():
+            with reader:
+                channels = reader.channels
+                leftover = np.zeros(0, dtype=np.float32)
+                for buf in reader:
+                    samples = np.concatenate([leftover, librosa.util.buf_to_float(buf, dtype=np.float32)])
+                    usable = len(samples) - len(samples) % channels
+                    leftover = samples[usable:]
+                    if usable:
+                        yield samples[:usable].reshape((-1, channels)).mean(axis=1, dtype=np.float32)
+        return reader.samplerate, read_audioread_blocks
+
+
+def open_audio_stream(audio_path, sr=None, block_length=32768):
+    """
+    Opens an audio file for block-wise reading without loading it into memory.
+
+    Reads blocks with open_native_blocks(), downmixed to mono, and, when sr differs
+    from the file's rate, resamples them with a streaming soxr resampler (the same
+    'soxr_hq' filter librosa.load uses).
+
+    Args:
+        audio_path (str): Path to the audio file.
+        sr (int, optional): Target sample rate. None keeps the native rate.
+        block_length (int): Number of native-rate samples read per block.
+    Returns:
+        tuple: (sample_rate, generator of mono float32 sample blocks)
+    """
+    native_sr, read_native_blocks = open_native_blocks(audio_path, block_length)
+
+    if sr is None or sr == native_sr:
+        return native_sr, read_native_blocks()
+
+    def resampled_blocks():
+        import soxr
+        resampler = soxr.ResampleStream(native_sr, sr, 1, dtype='float32', quality='HQ')
+        total_in = 0
+        emitted = 0
+        for block in read_native_blocks():
+            total_in += len(block)
+            out = resampler.resample_chunk(block, last=False)
+            emitted += len(out)
+            if len(out):
+                yield out
+        # Match librosa.resample's output length of ceil(n * sr / native_sr).
+        expected = int(np.ceil(total_in * float(sr) / native_sr))
+        out = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)[:max(expected - emitted, 0)]
+        if emitted + len(out) < expected:
+            out = np.concatenate([out, np.zeros(expected - emitted - len(out), dtype=np.float32)])
+        if len(out):
+            yield out
+
+    return sr, resampled_blocks()
+
+
+def native_sample_rate(audio_path):
+    """Returns the sample rate stored in an audio file without decoding it."""
+    mapped = map_wav_samples(audio_path)
+    if mapped is not None:
+        return mapped[0]
+    if audio_path.lower().endswith(FFMPEG_CONTAINER_EXTENSIONS):
+        try:
+            return ffprobe_sample_rate(audio_path)
+        except (OSError, subprocess.CalledProcessError, ValueError, IndexError):
+            pass
+    try:
+        import soundfile as sf
+        return sf.info(audio_path).samplerate
+    except Exception:
+        import audioread
+        with audioread.audio_open(audio_path) as reader:
+            return reader.samplerate
+
+
+# Fraction of the Nyquist frequency the soxr_hq anti-aliasing filter passes untouched.
+DECIMATION_PASSBAND = 0.9
+
+
+def choose_decimation_factor(sr, frame_size, hop_length, freq_max):
+    """
+    Largest power-of-two factor q by which the signal can be decimated while
+    keeping freq_max inside the resampler's passband.
+
+    q must divide sr, frame_size and hop_length so that analysing at sr / q with
+    frame_size / q and hop_length / q yields exactly the same bin frequencies and
+    frame times as the full-rate analysis.
+    """
+    q = 1
+    while (sr % (2 * q) == 0 and frame_size % (2 * q) == 0 and hop_length % (2 * q) == 0
+           and frame_size // (2 * q) >= 16 and DECIMATION_PASSBAND * sr / (4 * q) >= freq_max):
+        q *= 2
+    return q
+
+
+def iter_stft_frames(blocks, frame_size, hop_length, center=True):
+    """
+    Groups a stream of sample blocks into arrays of overlapping frames.
+
+    With center=True the stream is zero-padded by frame_size // 2 on both ends,
+    so the frames are exactly those librosa.stft(center=True) would transform.
+    Only one block plus one frame of samples is held at any time.
+
+    Yields:
+        np.ndarray: (n_frames, frame_size) frames, in order.
+    """
+    pad = np.zeros(frame_size // 2, dtype=np.float32)
+    buffer = pad if center else np.zeros(0, dtype=np.float32)
+
+    def take_frames(buffer):
+        if len(buffer) < frame_size:
+            return None, buffer
+        n_frames = 1 + (len(buffer) - frame_size) // hop_length
+        frames = librosa.util.frame(buffer, frame_length=frame_size, hop_length=hop_length, axis=0)[:n_frames]
+        return frames, buffer[n_frames * hop_length:]
+
+    for block in blocks:
+        frames, buffer = take_frames(np.concatenate([buffer, block]))
+        if frames is not None:
+            yield frames
+
+    if center:
+        frames, buffer = take_frames(np.concatenate([buffer, pad]))
+        if frames is not None:
+            yield frames
+
+
+class StageProfiler:
+    """
+    Records wall time and peak traced memory for each named stage of an analysis
+    (decode, resample, stft, averaging, peak_picking, note_conversion, ...).
+
+    Pass one to extract_prominent_frequencies(profiler=...) and read report()
+    afterwards. A stage entered several times (e.g. once per streamed block)
+    accumulates its time and keeps its largest peak. Memory is measured with
+    tracemalloc, which numpy reports its buffers to; tracing is started on the
+    first stage if it is not already running and stopped by report().
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self._started_tracing = False
+        self._start = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self._start is None:
+            self._start = time.perf_counter()
+        tracemalloc.reset_peak()
+        current_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_bytes = tracemalloc.get_traced_memory()[1] - current_before
+            record = self.stages.setdefault(name, {"wall_s": 0.0, "peak_mb": 0.0, "calls": 0})
+            record["wall_s"] += elapsed
+            record["peak_mb"] = max(record["peak_mb"], peak_bytes / (1024 * 1024))
+            record["calls"] += 1
+
+    def iterate(self, name, iterable):
+        """Yields from iterable, timing each step as stage name (e.g. decoding streamed blocks)."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        """Returns {'stages': {name: {'wall_s', 'peak_mb', 'calls'}}, 'total_s'} and stops tracing."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        total_s = time.perf_counter() - self._start if self._start is not None else 0.0
+        return {"stages": self.stages, "total_s": total_s}
+
+
+# Stand-in used when no profiler is passed, so instrumented code needs no branches.
+NO_PROFILER = StageProfiler(enabled=False)
+
+
+def fused_band_mean_magnitude(D, start, stop):
+    """
+    Mean magnitude over time of rows start:stop of a complex STFT matrix, in one
+    pass without materialising np.abs(D). Compiled by numba_kernels().
+
+    Frames are the outer loop because librosa.stft returns a Fortran-ordered
+    matrix, so the inner loop over bins walks contiguous memory. Magnitudes are
+    taken in float64 with a plain square root rather than hypot, which is
+    faster and agrees with np.abs to within one float32 ulp after averaging.
+    """
+    n_frames = D.shape[1]
+    sums = np.zeros(stop - start, dtype=np.float64)
+    for t in range(n_frames):
+        for k in range(start, stop):
+            re = np.float64(D[k, t].real)
+            im = np.float64(D[k, t].imag)
+            sums[k - start] += np.sqrt(re * re + im * im)
+    return sums / max(n_frames, 1)
+
+
+def select_prominent_peaks(x, prominence_threshold, valid, top_n):
+    """
+    Peaks of x with prominence >= prominence_threshold, loudest first, limited
+    to the top_n peaks whose valid flag is set. Compiled by numba_kernels().
+
+    Ports scipy.signal.find_peaks(x, prominence=...) exactly: local maxima
+    (the middle of flat plateaus) and prominences with an unbounded window.
+    Equal magnitudes are ranked lower bin first, like the stable argsort in
+    AnalysisPlan.pick_notes.
+    """
+    n = x.shape[0]
+    candidates = np.empty(max(n // 2, 1), dtype=np.int64)
+    n_candidates = 0
+    i = 1
+    while i < n - 1:
+        if x[i - 1] < x[i]:
+            i_ahead = i + 1
+            while i_ahead < n - 1 and x[i_ahead] == x[i]:
+                i_ahead += 1
+            if x[i_ahead] < x[i]:
+                peak = (i + i_ahead - 1) // 2
+                height = np.float64(x[peak])
+
+                left_min = height
+                j = peak
+                while j >= 0 and x[j] <= x[peak]:
+                    if x[j] < left_min:
+                        left_min = np.float64(x[j])
+                    j -= 1
+                right_min = height
+                j = peak
+                while j <= n - 1 and x[j] <= x[peak]:
+                    if x[j] < right_min:
+                        right_min = np.float64(x[j])
+                    j += 1
+
+                if valid[peak] and height - max(left_min, right_min) >= prominence_threshold:
+                    candidates[n_candidates] = peak
+                    n_candidates += 1
+                i = i_ahead
+        i += 1
+
+    # Partial selection sort: top_n is small compared to the number of peaks.
+    n_selected = min(top_n, n_candidates)
+    for r in range(n_selected):
+        best = r
+        for c in range(r + 1, n_candidates):
+            if x[candidates[c]] > x[candidates[best]] or (
+                    x[candidates[c]] == x[candidates[best]] and candidates[c] < candidates[best]):
+                best = c
+        candidates[r], candidates[best] = candidates[best], candidates[r]
+    return candidates[:n_selected].copy()
+
+
+@functools.lru_cache(maxsize=None)
+def numba_kernels():
+    """
+    JIT-compiles fused_band_mean_magnitude and select_prominent_peaks with numba.
+    cache=True stores the machine code next to this module, so only the first
+    run on a machine pays the compilation.
+
+    Returns:
+        tuple: (band_mean_magnitude, select_peaks), or None if numba is not installed.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+    return (numba.njit(cache=True)(fused_band_mean_magnitude),
+            numba.njit(cache=True)(select_prominent_peaks))
+
+
+@functools.lru_cache(maxsize=None)
+def note_name_table():
+    """Returns an object array mapping every MIDI number 0-127 to its note name."""
+    return np.array([midi_to_note_name(midi) for midi in range(128)], dtype=object)
+
+
+def parabolic_peak_offsets(alpha, beta, gamma):
+    """
+    Offsets (in bins, within +-0.5) of the vertices of the parabolas through the
+    log magnitudes alpha, beta, gamma of peak bins and their lower and upper
+    neighbours; 0 where the three points do not curve downwards.
+    """
+    curvature = alpha - 2 * beta + gamma
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(curvature < 0, 0.5 * (alpha - gamma) / curvature, 0.0)
+
+
+class AnalysisPlan:
+    """
+    Everything extract_prominent_frequencies derives from its parameters rather
+    than from the audio: the STFT window, the slice of bins inside
+    [freq_min, freq_max], the (octave-constrained) MIDI note of every bin in
+    that slice and the MIDI -> note name table. Building it once lets repeated
+    analyses skip the setup and turn the per-peak note conversion into array
+    lookups. Use get_analysis_plan() to share plans between calls.
+    """
+
+    def __init__(self, sr, frame_size=2048, hop_length=512, freq_min=20, freq_max=20000,
+                 constrain_octave_start_note=None):
+        self.sr = sr
+        self.frame_size = frame_size
+        self.hop_length = hop_length
+        self.window = librosa.filters.get_window('hann', frame_size, fftbins=True)
+        self.frequencies = librosa.fft_frequencies(sr=sr, n_fft=frame_size)
+
+        # fft_frequencies is increasing, so the valid bins form one contiguous slice.
+        valid_freq_indices = np.where((self.frequencies >= freq_min) & (self.frequencies <= freq_max))[0]
+        if valid_freq_indices.size:
+            self.bin_slice = slice(valid_freq_indices[0], valid_freq_indices[-1] + 1)
+        else:
+            self.bin_slice = slice(0, 0)
+        self.band_frequencies = self.frequencies[self.bin_slice]
+
+        self.target_constrain_midi_start = None
+        if constrain_octave_start_note:
+            self.target_constrain_midi_start = librosa.note_to_midi(constrain_octave_start_note)
+            if self.target_constrain_midi_start is None:
+                print(f"Warning: Could not convert '{constrain_octave_start_note}' to MIDI for octave constraint. Constraint will be ignored.")
+
+        self.bin_midi = self.midi_numbers(self.band_frequencies)
+        self.note_names = note_name_table()
+        self._pitch_class_tables = {}
+
+    def midi_numbers(self, frequencies):
+        """
+        Same conversion as freq_to_midi + round + constrain_midi_to_octave, for a whole
+        array of frequencies at once (non-positive frequencies map to MIDI 0).
+        """
+        midi = np.zeros(frequencies.shape, dtype=np.int64)
+        positive = frequencies > 0
+        midi[positive] = np.round(librosa.hz_to_midi(frequencies[positive])).astype(np.int64)
+        if self.target_constrain_midi_start is not None:
+            start = int(self.target_constrain_midi_start)
+            midi = ((midi - start) % 12 + 12) % 12 + start
+        return midi
+
+    def interpolate_peaks(self, average_spectrum, band_peaks):
+        """
+        Sub-bin frequencies of peaks by fitting a parabola through the log magnitudes
+        of each peak bin and its two neighbours (quadratic interpolation, accurate to a
+        few hundredths of a bin for a Hann window). Neighbours are taken from the full
+        spectrum, so peaks at the band edges are refined too.
+
+        Args:
+            average_spectrum (np.ndarray): Full-band average spectrum.
+            band_peaks (np.ndarray): Peak indices relative to bin_slice.
+        Returns:
+            np.ndarray: Interpolated peak frequencies in Hz.
+        """
+        bins = self.bin_slice.start + band_peaks
+        inner = (bins > 0) & (bins < len(average_spectrum) - 1)
+        log_spectrum = np.log(np.maximum(average_spectrum, np.finfo(np.float32).tiny).astype(np.float64))
+        alpha = log_spectrum[np.where(inner, bins - 1, bins)]
+        beta = log_spectrum[bins]
+        gamma = log_spectrum[np.where(inner, bins + 1, bins)]
+        return (bins + np.where(inner, parabolic_peak_offsets(alpha, beta, gamma), 0.0)) * self.sr / self.frame_size
+
+    def average_spectrum(self, y, profiler=NO_PROFILER):
+        """Mean STFT magnitude of y over time, for all frame_size // 2 + 1 bins."""
+        with profiler.stage("stft"):
+            D = librosa.stft(y, n_fft=self.frame_size, hop_length=self.hop_length, window=self.window)
+        with profiler.stage("averaging"):
+            return np.mean(np.abs(D), axis=1, dtype=np.float64).astype(np.float32)
+
+    def fused_average_spectrum(self, y, full_band=False, profiler=NO_PROFILER):
+        """
+        average_spectrum() through the numba kernel, which averages magnitudes
+        straight from the complex STFT. Only bins inside bin_slice are computed
+        (the rest stay zero) unless full_band is set, e.g. for a spectrum sidecar.
+        Falls back to average_spectrum() when numba is not installed.
+        """
+        kernels = numba_kernels()
+        if kernels is None:
+            return self.average_spectrum(y, profiler=profiler)
+        with profiler.stage("stft"):
+            D = librosa.stft(y, n_fft=self.frame_size, hop_length=self.hop_length, window=self.window)
+        with profiler.stage("averaging"):
+            start, stop = (0, D.shape[0]) if full_band else (self.bin_slice.start, self.bin_slice.stop)
+            spectrum = np.zeros(D.shape[0], dtype=np.float32)
+            spectrum[start:stop] = kernels[0](D, start, stop)
+            return spectrum
+
+    def channel_spectra(self, y, profiler=NO_PROFILER):
+        """
+        Mean STFT magnitude of every channel of a (n_channels, n_samples) array,
+        from one batched STFT over all channels at once.
+
+        Returns:
+            np.ndarray: float32 (n_channels, frame_size // 2 + 1) spectra; row c
+                        equals average_spectrum(y[c]).
+        """
+        with profiler.stage("stft"):
+            D = librosa.stft(y, n_fft=self.frame_size, hop_length=self.hop_length, window=self.window)
+        with profiler.stage("averaging"):
+            return np.mean(np.abs(D), axis=-1, dtype=np.float64).astype(np.float32)
+
+    def frame_magnitudes(self, frames):
+        """Magnitude spectra of a (n_frames, frame_size) array of frames, as from iter_stft_frames."""
+        # scipy.fft releases the GIL, which lets parallel_average_spectrum use threads.
+        return np.abs(scipy_fft.rfft(frames * self.window, axis=1))
+
+    def centered_frames(self, y):
+        """
+        (n_frames, frame_size) view, without copying, of y zero-padded by frame_size // 2
+        on both ends: the hop-aligned overlapping frames librosa.stft(center=True) uses.
+        """
+        padded = np.pad(y, self.frame_size // 2)
+        if len(padded) < self.frame_size:
+            raise ValueError("Audio is shorter than one frame.")
+        return librosa.util.frame(padded, frame_length=self.frame_size, hop_length=self.hop_length, axis=0)
+
+    def parallel_average_spectrum(self, y, workers=None, frames_per_task=256, profiler=NO_PROFILER):
+        """
+        Mean STFT magnitude of y computed on several cores.
+
+        Contiguous runs of centered_frames(y) are transformed in a thread pool,
+        each thread returns a float64 partial sum, and the partial sums are added
+        and divided by the frame count once.
+        """
+        workers = workers or os.cpu_count() or 1
+        frames = self.centered_frames(y)
+        n_frames = len(frames)
+
+        def partial_sum(start):
+            return self.frame_magnitudes(frames[start:start + frames_per_task]).sum(axis=0, dtype=np.float64)
+
+        # The threads transform and sum together, so this is reported as one stft stage.
+        with profiler.stage("stft"), ThreadPoolExecutor(max_workers=workers) as pool:
+            partial_sums = list(pool.map(partial_sum, range(0, n_frames, frames_per_task)))
+        with profiler.stage("averaging"):
+            return (np.sum(partial_sums, axis=0) / n_frames).astype(np.float32)
+
+    def stream_average_spectrum(self, blocks, profiler=NO_PROFILER):
+        """
+        Mean STFT magnitude over a stream of sample blocks (see open_audio_stream).
+
+        Equivalent to average_spectrum() on the concatenated blocks, but only one
+        block of frames is transformed at a time.
+        """
+        spectrum_sum = np.zeros(self.frame_size // 2 + 1, dtype=np.float64)
+        n_frames = 0
+        for frames in iter_stft_frames(profiler.iterate("decode", blocks), self.frame_size, self.hop_length):
+            with profiler.stage("stft"):
+                magnitudes = self.frame_magnitudes(frames)
+            with profiler.stage("averaging"):
+                spectrum_sum += magnitudes.sum(axis=0)
+            n_frames += len(frames)
+
+        if n_frames == 0:
+            raise ValueError("Audio file contains no samples.")
+        return (spectrum_sum / n_frames).astype(np.float32)
+
+    def gated_average_spectrum(self, frame_blocks, gate, profiler=NO_PROFILER):
+        """
+        Mean STFT magnitude over only the frames an EnergyGate lets through.
+
+        Args:
+            frame_blocks (iterable): (n_frames, frame_size) arrays in time order, e.g.
+                                     from iter_stft_frames or slices of centered_frames.
+            gate (EnergyGate): Decides per frame, from its RMS, whether to transform it.
+        Returns:
+            np.ndarray: Average spectrum of the selected frames (all zeros if none were).
+        """
+        spectrum_sum = np.zeros(self.frame_size // 2 + 1, dtype=np.float64)
+        n_frames = 0
+        for frames in frame_blocks:
+            with profiler.stage("gate"):
+                selected = frames[gate.select(frames)]
+            if len(selected):
+                with profiler.stage("stft"):
+                    magnitudes = self.frame_magnitudes(selected)
+                with profiler.stage("averaging"):
+                    spectrum_sum += magnitudes.sum(axis=0)
+                n_frames += len(selected)
+        if n_frames == 0:
+            print("No frames above the energy gate.")
+            return spectrum_sum.astype(np.float32)
+        return (spectrum_sum / n_frames).astype(np.float32)
+
+    def pick_notes(self, average_spectrum, top_n=12, prominence_factor=0.2, interpolate=False,
+                   use_numba=False, profiler=NO_PROFILER):
+        """
+        Picks the prominent peaks of a full-band average spectrum and names them.
+
+        With interpolate=True each peak's frequency is refined with
+        interpolate_peaks() before it is converted to a note, so small FFT sizes
+        still name low partials correctly. With use_numba=True (and numba
+        installed) peaks are found and ranked by the compiled
+        select_prominent_peaks kernel instead of find_peaks and argsort.
+
+        Returns:
+            list: (note_name, average_magnitude, original_frequency) tuples, loudest first.
+        """
+        band_spectrum = average_spectrum[self.bin_slice]
+        if band_spectrum.size == 0:
+            return []
+
+        kernels = numba_kernels() if use_numba else None
+        if kernels is not None and not interpolate:
+            with profiler.stage("peak_picking"):
+                prominence_threshold = float(prominence_factor * np.max(band_spectrum))
+                has_note = (self.bin_midi >= 0) & (self.bin_midi <= 127)
+                ranked = kernels[1](band_spectrum, prominence_threshold, has_note, top_n)
+            with profiler.stage("note_conversion"):
+                note_names = self.note_names[self.bin_midi[ranked]]
+                return list(zip(note_names.tolist(), band_spectrum[ranked], self.band_frequencies[ranked]))
+
+        with profiler.stage("peak_picking"):
+            prominence_threshold = prominence_factor * np.max(band_spectrum)
+            peaks, properties = find_peaks(band_spectrum, prominence=prominence_threshold)
+            if interpolate:
+                peak_frequencies = self.interpolate_peaks(average_spectrum, peaks)
+
+        with profiler.stage("note_conversion"):
+            if interpolate:
+                peak_midi = self.midi_numbers(peak_frequencies)
+            else:
+                peak_frequencies = self.band_frequencies[peaks]
+                peak_midi = self.bin_midi[peaks]
+            has_note = (peak_midi >= 0) & (peak_midi <= 127)
+            peaks, peak_frequencies, peak_midi = peaks[has_note], peak_frequencies[has_note], peak_midi[has_note]
+
+            # Loudest first; a stable sort keeps equal magnitudes in pitch order like list.sort did.
+            order = np.argsort(-band_spectrum[peaks], kind='stable')[:top_n]
+            note_names = self.note_names[peak_midi[order]]
+            return list(zip(note_names.tolist(), band_spectrum[peaks[order]], peak_frequencies[order]))
+
+    def pitch_class_table(self, resolution=12):
+        """
+        Names and centre frequencies of resolution pitch classes per octave
+        (12 = semitones, 24 = quarter tones, ...), in the order fold_pitch_classes()
+        returns them. Classes are named in the constraint octave (C4 when no
+        constraint is set), starting from its first note.
+        """
+        if resolution not in self._pitch_class_tables:
+            class_midi = self.octave_start_midi() + np.arange(resolution) * 12 / resolution
+            class_names = [librosa.midi_to_note(midi, cents=resolution > 12) for midi in class_midi]
+            self._pitch_class_tables[resolution] = (class_names, librosa.midi_to_hz(class_midi))
+        return self._pitch_class_tables[resolution]
+
+    def octave_start_midi(self):
+        """MIDI number of the note pitch classes are named from: the constraint octave's start, or C4."""
+        return 60 if self.target_constrain_midi_start is None else int(self.target_constrain_midi_start)
+
+    def fold_pitch_classes(self, band_spectra, resolution=12, prominence_factor=0.2):
+        """
+        Folds the peaks of in-band spectra onto resolution pitch classes per octave.
+
+        A bin is a peak if it is greater than its lower neighbour, at least its upper
+        neighbour and at least prominence_factor times its spectrum's maximum (the
+        test of pick_peaks_2d). Each peak's frequency is refined by a parabola through
+        the log magnitudes of it and its neighbours, and its magnitude is added to
+        the class nearest that frequency. Only peaks are folded, so the window's
+        main-lobe skirts around each partial do not leak into the neighbouring classes.
+        All spectra are folded at once with array operations, without a per-peak search.
+
+        Args:
+            band_spectra (np.ndarray): (n_bins,) or (n_spectra, n_bins) magnitudes over band_frequencies.
+            resolution (int): Classes per octave (12, 24 or 36).
+            prominence_factor (float): Peak height threshold relative to each spectrum's maximum.
+        Returns:
+            np.ndarray: float32 (n_spectra, resolution) class magnitudes, classes ordered as
+                        in pitch_class_table().
+        """
+        spectra = np.atleast_2d(band_spectra)
+        n_spectra, n_bins = spectra.shape
+        if n_bins < 3:
+            return np.zeros((n_spectra, resolution), dtype=np.float32)
+
+        centre = spectra[:, 1:-1]
+        is_peak = ((centre > spectra[:, :-2]) & (centre >= spectra[:, 2:]) & (centre > 0)
+                   & (centre >= prominence_factor * spectra.max(axis=1, keepdims=True)))
+        rows, bins = np.nonzero(is_peak)
+        bins += 1
+        log_spectra = np.log(np.maximum(spectra[rows[:, None], bins[:, None] + np.arange(-1, 2)],
+                                        np.finfo(np.float32).tiny).astype(np.float64))
+        offsets = parabolic_peak_offsets(log_spectra[:, 0], log_spectra[:, 1], log_spectra[:, 2])
+        peak_frequencies = self.band_frequencies[bins] + offsets * self.sr / self.frame_size
+
+        positive = peak_frequencies > 0
+        rows, bins, peak_frequencies = rows[positive], bins[positive], peak_frequencies[positive]
+        steps = np.round((librosa.hz_to_midi(peak_frequencies) - self.octave_start_midi())
+                         * resolution / 12).astype(np.int64) % resolution
+        folded = np.bincount(rows * resolution + steps, weights=spectra[rows, bins],
+                             minlength=n_spectra * resolution)
+        return folded.reshape(n_spectra, resolution).astype(np.float32)
+
+    def pick_pitch_classes(self, average_spectrum, resolution=12, top_n=12, prominence_factor=0.2,
+                           profiler=NO_PROFILER):
+        """
+        Ranks pitch classes instead of notes: the peaks of a full-band average
+        spectrum are folded onto the classes by fold_pitch_classes(), a few array
+        operations in place of pick_notes' find_peaks search and per-note naming.
+
+        Returns:
+            list: (class_name, folded_magnitude, class_frequency) tuples, loudest first,
+                  for classes reaching prominence_factor times the loudest class.
+        """
+        band_spectrum = average_spectrum[self.bin_slice]
+        if band_spectrum.size == 0:
+            return []
+        with profiler.stage("peak_picking"):
+            class_magnitudes = self.fold_pitch_classes(band_spectrum, resolution, prominence_factor)[0]
+            if not class_magnitudes.any():
+                return []
+            present = np.flatnonzero(class_magnitudes >= prominence_factor * np.max(class_magnitudes))
+            present = present[class_magnitudes[present] > 0]
+        with profiler.stage("note_conversion"):
+            class_names, class_frequencies = self.pitch_class_table(resolution)
+            ranked = present[np.argsort(-class_magnitudes[present], kind='stable')[:top_n]]
+            return [(class_names[i], class_magnitudes[i], class_frequencies[i]) for i in ranked]
+
+
+class EnergyGate:
+    """
+    Per-frame RMS gate that skips silence before the spectral stage.
+
+    A frame is active when its RMS is at least threshold_db dBFS; it and the
+    tail_frames frames after it are selected. State carries across calls, so a
+    decay tail continues into the next block of a stream.
+    """
+
+    def __init__(self, threshold_db=-50.0, tail_frames=0):
+        self.threshold_db = threshold_db
+        self.tail_frames = tail_frames
+        self.frames_since_active = tail_frames + 1
+
+    def select(self, frames):
+        """Boolean mask of the frames in a (n_frames, frame_size) array to keep."""
+        mean_square = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / frames.shape[1]
+        active = 10 * np.log10(mean_square + 1e-20) >= self.threshold_db
+        index = np.arange(len(frames))
+        # Distance from each frame back to the most recent active frame, carried across blocks.
+        last_active = np.maximum.accumulate(np.where(active, index, -1))
+        since_active = np.where(last_active >= 0, index - last_active, self.frames_since_active + index + 1)
+        if len(frames):
+            self.frames_since_active = int(since_active[-1])
+        return since_active <= self.tail_frames
+
+
+@functools.lru_cache(maxsize=32)
+def get_analysis_plan(sr, frame_size=2048, hop_length=512, freq_min=20, freq_max=20000,
+                      constrain_octave_start_note=None):
+    """Returns a shared AnalysisPlan for these parameters, building it on first use."""
+    return AnalysisPlan(sr, frame_size=frame_size, hop_length=hop_length, freq_min=freq_min,
+                        freq_max=freq_max, constrain_octave_start_note=constrain_octave_start_note)
+
+
+def parse_target_pitches(target_pitches):
+    """
+    Converts candidate pitches given as note names ('C4', 'F#3') or frequencies
+    (440, '261.6') into a list of (note_name, frequency_hz) pairs. Frequencies are
+    labelled with their nearest note name.
+    """
+    parsed = []
+    for target in target_pitches:
+        try:
+            frequency = float(target)
+            note_name = midi_to_note_name(int(round(freq_to_midi(frequency))))
+        except ValueError:
+            midi_note = librosa.note_to_midi(target.strip())
+            frequency = float(librosa.midi_to_hz(midi_note))
+            note_name = midi_to_note_name(int(round(midi_note)))
+        parsed.append((note_name, frequency))
+    return parsed
+
+
+@functools.lru_cache(maxsize=32)
+def get_target_kernel(sr, frame_size, target_frequencies):
+    """
+    Windowed DFT kernel measuring only target_frequencies (a tuple of Hz).
+
+    Column k is the Hann window times exp(-2j*pi*f_k*n/sr), so frames @ kernel
+    gives, for each target, the value the STFT would have at exactly that
+    frequency. It is returned as a real (frame_size, 2 * n_targets) float32 matrix
+    ([cos | sin] columns) so the whole measurement is one real matrix product.
+    """
+    window = librosa.filters.get_window('hann', frame_size, fftbins=True)
+    phase = 2 * np.pi * np.outer(np.arange(frame_size), np.asarray(target_frequencies)) / sr
+    return np.hstack([window[:, None] * np.cos(phase), window[:, None] * np.sin(phase)]).astype(np.float32)
+
+
+def measure_target_pitches(audio_path, target_pitches, top_n=12, frame_size=2048, hop_length=512, sr=None,
+                           prominence_factor=0.2, block_frames=64):
+    """
+    Measures only the given candidate pitches instead of every FFT bin.
+
+    Each frame is projected onto a precomputed windowed-DFT kernel with one
+    column pair per target (a vectorized Goertzel bank), so the work per frame
+    grows with the number of targets rather than with frame_size, and there is
+    no peak search. The audio is read block by block as in streaming mode.
+
+    Returns:
+        list: (note_name, average_magnitude, target_frequency) tuples, loudest first,
+              for targets whose magnitude is at least prominence_factor times the loudest.
+    """
+    targets = parse_target_pitches(target_pitches)
+    if not targets:
+        return []
+    sr, blocks = open_audio_stream(audio_path, sr=sr, block_length=block_frames * hop_length)
+    kernel = get_target_kernel(sr, frame_size, tuple(frequency for _, frequency in targets))
+    n_targets = len(targets)
+
+    magnitude_sum = np.zeros(n_targets, dtype=np.float64)
+    n_frames = 0
+    for frames in iter_stft_frames(blocks, frame_size, hop_length):
+        projections = frames @ kernel
+        magnitude_sum += np.hypot(projections[:, :n_targets], projections[:, n_targets:]).sum(axis=0)
+        n_frames += len(frames)
+    if n_frames == 0:
+        raise ValueError("Audio file contains no samples.")
+
+    average_magnitudes = (magnitude_sum / n_frames).astype(np.float32)
+    present = np.flatnonzero(average_magnitudes >= prominence_factor * np.max(average_magnitudes))
+    ranked = present[np.argsort(-average_magnitudes[present], kind='stable')[:top_n]]
+    return [(targets[i][0], average_magnitudes[i], np.float64(targets[i][1])) for i in ranked]
+
+
+def stream_average_spectrum(audio_path, frame_size=2048, hop_length=512, sr=None, block_frames=64):
+    """
+    Computes the mean STFT magnitude spectrum of a file block by block.
+
+    Equivalent to np.mean(np.abs(librosa.stft(y, n_fft=frame_size, hop_length=hop_length)), axis=1)
+    on the output of librosa.load, but peak memory depends on frame_size and
+    block_frames rather than on the length of the recording.
+
+    Returns:
+        tuple: (sample_rate, average_spectrum over all frame_size // 2 + 1 bins)
+    """
+    sr, blocks = open_audio_stream(audio_path, sr=sr, block_length=block_frames * hop_length)
+    plan = get_analysis_plan(sr, frame_size=frame_size, hop_length=hop_length)
+    return sr, plan.stream_average_spectrum(blocks)
+
+
+# numpy dtypes of the raw PCM formats accepted on stdin (ffmpeg -f names).
+PCM_FORMATS = {"f32le": "<f4", "s16le": "<i2"}
+
+
+def iter_pcm_blocks(stream, pcm_format="f32le", channels=1, block_length=4096):
+    """
+    Reads interleaved raw PCM (e.g. from `ffmpeg ... -f f32le -`) from a binary
+    stream and yields mono float32 blocks as soon as data arrives.
+    """
+    dtype = np.dtype(PCM_FORMATS[pcm_format])
+    frame_bytes = dtype.itemsize * channels
+    # read1 returns whatever the pipe has instead of waiting for a full block.
+    read = getattr(stream, "read1", stream.read)
+    leftover = b""
+    while True:
+        chunk = read(block_length * frame_bytes)
+        if not chunk:
+            break
+        data = leftover + chunk
+        usable = len(data) - len(data) % frame_bytes
+        leftover = data[usable:]
+        if not usable:
+            continue
+        samples = np.frombuffer(data[:usable], dtype=dtype)
+        if dtype.kind == "i":
+            samples = samples.astype(np.float32) / 32768.0
+        else:
+            samples = samples.astype(np.float32)
+        if channels > 1:
+            samples = samples.reshape((-1, channels)).mean(axis=1, dtype=np.float32)
+        yield samples
+
+
+def live_prominent_notes(stream, sr=48000, pcm_format="f32le", channels=1, window_seconds=5.0, emit_interval=1.0,
+                         top_n=12, frame_size=2048, hop_length=512, freq_min=20, freq_max=20000,
+                         prominence_factor=0.2, constrain_octave_start_note=None):
+    """
+    Rolling analysis of a live PCM stream.
+
+    Keeps the magnitude spectra of the most recent window_seconds of frames in a
+    ring buffer and, every emit_interval seconds of audio, picks the prominent
+    notes of their average, so results are available while the bells are still
+    sounding instead of after a fixed-length recording.
+
+    Yields:
+        dict: {'time': seconds of audio consumed, 'notes', 'magnitudes', 'frequencies'}
+    """
+    plan = get_analysis_plan(sr, frame_size=frame_size, hop_length=hop_length, freq_min=freq_min,
+                             freq_max=freq_max, constrain_octave_start_note=constrain_octave_start_note)
+    window_frames = max(1, int(round(window_seconds * sr / hop_length)))
+    emit_every = max(1, int(round(emit_interval * sr / hop_length)))
+    ring = np.zeros((window_frames, frame_size // 2 + 1), dtype=np.float32)
+    ring_pos = 0
+    ring_filled = 0
+    frames_seen = 0
+    next_emit = emit_every
+
+    def rolling_record(frames_seen):
+        average_spectrum = ring[:ring_filled].mean(axis=0, dtype=np.float64).astype(np.float32)
+        prominent_notes_data = plan.pick_notes(average_spectrum, top_n=top_n, prominence_factor=prominence_factor)
+        return {
+            "time": (frames_seen * hop_length + frame_size - hop_length) / sr,
+            "notes": [item[0] for item in prominent_notes_data],
+            "magnitudes": [float(item[1]) for item in prominent_notes_data],
+            "frequencies": [float(item[2]) for item in prominent_notes_data],
+        }
+
+    blocks = iter_pcm_blocks(stream, pcm_format=pcm_format, channels=channels, block_length=hop_length * 8)
+    for frames in iter_stft_frames(blocks, frame_size, hop_length, center=False):
+        magnitudes = plan.frame_magnitudes(frames)
+        if len(magnitudes) >= window_frames:
+            ring[:] = magnitudes[-window_frames:]
+            ring_pos = 0
+        else:
+            ring[(ring_pos + np.arange(len(magnitudes))) % window_frames] = magnitudes
+            ring_pos = (ring_pos + len(magnitudes)) % window_frames
+        ring_filled = min(ring_filled + len(magnitudes), window_frames)
+        frames_seen += len(magnitudes)
+
+        if frames_seen >= next_emit:
+            yield rolling_record(frames_seen)
+            next_emit = frames_seen + emit_every
+
+    # Report whatever arrived after the last result when the stream ends.
+    if frames_seen and frames_seen != next_emit - emit_every:
+        yield rolling_record(frames_seen)
+
+
+def spectrum_sidecar_path(audio_path):
+    """Default sidecar location for audio_path: the same name with a .spectrum.npz extension."""
+    return os.path.splitext(audio_path)[0] + ".spectrum.npz"
+
+
+def save_spectrum_sidecar(path, average_spectrum, sr, frame_size, hop_length):
+    """
+    Saves a full-band average spectrum and its frequency axis to a compressed .npz,
+    so peak picking can be re-run with new thresholds without decoding or STFT.
+    """
+    np.savez_compressed(
+        path,
+        average_spectrum=np.asarray(average_spectrum, dtype=np.float32),
+        frequencies=librosa.fft_frequencies(sr=sr, n_fft=frame_size),
+        sr=sr,
+        frame_size=frame_size,
+        hop_length=hop_length,
+    )
+
+
+def load_spectrum_sidecar(path):
+    """Loads a sidecar written by save_spectrum_sidecar into a dict."""
+    with np.load(path) as data:
+        return {
+            "average_spectrum": data["average_spectrum"],
+            "frequencies": data["frequencies"],
+            "sr": int(data["sr"]),
+            "frame_size": int(data["frame_size"]),
+            "hop_length": int(data["hop_length"]),
+        }
+
+
+# Bump when a change to the analysis alters its results, so stale cache entries stop matching.
+ANALYSIS_CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ANALYZE_AUDIO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "singing_hollow", "analysis"))
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Returns the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed on-disk cache for extract_prominent_frequencies results.
+
+    Entries are keyed by the hash of the audio file's contents plus every
+    parameter that affects the result, so renamed or re-copied takes still hit
+    and any parameter change misses. Each entry is a small JSON file; reading an
+    entry refreshes its modification time, and once the directory grows past
+    max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, audio_path, params):
+        """Cache key for analysing audio_path with the given parameter dict."""
+        payload = json.dumps({
+            "version": ANALYSIS_CACHE_VERSION,
+            "audio_sha256": file_sha256(audio_path),
+            "params": params,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        """Returns the cached note list for key, or None on a miss."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as f:
+                entries = json.load(f)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return [(note_name, np.float32(mag), np.float64(freq)) for note_name, mag, freq in entries]
+
+    def put(self, key, notes_data):
+        """
+        Stores a note list under key, then evicts old entries if over the size cap.
+        Best effort: a cache that cannot be written (disk full, read-only
+        directory) only prints a warning, so the analysis result is still returned.
+        """
+        entries = [[note_name, float(mag), float(freq)] for note_name, mag, freq in notes_data]
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            # Atomic, so concurrent batch workers never read a half-written entry.
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            print(f"Warning: could not write analysis cache entry: {e}", file=sys.stderr)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith(".json")]
+        except OSError:
+            return
+        stats = []
+        for entry in entries:
+            try:
+                stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except OSError:
+                continue
+        total_bytes = sum(size for _, size, _ in stats)
+        for _, size, entry_path in sorted(stats):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+                total_bytes -= size
+            except OSError:
+                pass
+
+
 def extract_prominent_frequencies(audio_path, top_n=12, frame_size=2048, hop_length=512, sr=None, freq_min=20, freq_max=20000,
-                                  prominence_factor=0.2, constrain_octave_start_note=None):
+                                  prominence_factor=0.2, constrain_octave_start_note=None, streaming=False, block_frames=64,
+                                  cache=None, save_spectrum=None, target_pitches=None, pitch_classes=None,
+                                  decimate=False, stft_workers=1, interpolate=False, gate_db=None, gate_tail=0.5,
+                                  profiler=None, use_numba=False):
     """
     Extracts the N most prominent frequencies, converts them to MIDI note numbers,
     and optionally constrains them to a single octave, along with their average magnitudes
@@ -69,69 +1255,529 @@ def extract_prominent_frequencies(audio_path, top_n=12, frame_size=2048, hop_len
         prominence_factor (float): Factor for peak prominence threshold.
         constrain_octave_start_note (str, optional): If provided (e.g., "C4"),
                                                      notes will be constrained to this octave.
+        streaming (bool): If True, read the file in blocks and keep a running mean of the
+                          magnitude spectrum instead of holding the whole STFT in memory.
+        block_frames (int): Number of hops read per block in streaming mode.
+        cache (AnalysisCache, optional): If provided, results are looked up by file
+                                         contents and parameters before analysing.
+        save_spectrum (str, optional): Path of a .npz sidecar to save the average spectrum to.
+                                       Passing such a sidecar as audio_path re-runs only the
+                                       peak picking (sr, frame_size and hop_length come from it).
+        target_pitches (list, optional): Note names or frequencies to measure instead of
+                                         searching the whole spectrum (see measure_target_pitches).
+                                         Names are reported as given, without octave constraint.
+        pitch_classes (int, optional): If set (12, 24 or 36), fold the spectral peaks into that
+                                       many pitch classes per octave and rank the classes instead
+                                       of notes (see AnalysisPlan.pick_pitch_classes).
+        profiler (StageProfiler, optional): Receives wall time and peak memory of each stage.
+        use_numba (bool): Average the in-memory STFT and pick peaks with the compiled
+                          numba kernels (same result; ignored if numba is not installed).
     Returns:
         list: A list of tuples (note_name, average_magnitude, original_frequency)
               for the top N frequencies, sorted by pitch (lowest to highest).
     """
+    profiler = profiler or NO_PROFILER
+
+    if audio_path.endswith(".npz"):
+        try:
+            with profiler.stage("decode"):
+                sidecar = load_spectrum_sidecar(audio_path)
+        except Exception as e:
+            print(f"Error loading spectrum file: {e}")
+            return []
+        plan = get_analysis_plan(sidecar["sr"], frame_size=sidecar["frame_size"], hop_length=sidecar["hop_length"],
+                                 freq_min=freq_min, freq_max=freq_max,
+                                 constrain_octave_start_note=constrain_octave_start_note)
+        if plan.band_frequencies.size == 0:
+            print("No frequencies found within the specified Hz range.")
+            return []
+        if pitch_classes:
+            return plan.pick_pitch_classes(sidecar["average_spectrum"], resolution=pitch_classes, top_n=top_n,
+                                           prominence_factor=prominence_factor, profiler=profiler)
+        return plan.pick_notes(sidecar["average_spectrum"], top_n=top_n, prominence_factor=prominence_factor,
+                               interpolate=interpolate, use_numba=use_numba, profiler=profiler)
+
+    if cache is not None:
+        # streaming, block_frames, stft_workers and use_numba only change how the spectrum is computed, not the result.
+        params = {
+            "top_n": top_n, "frame_size": frame_size, "hop_length": hop_length, "sr": sr,
+            "freq_min": freq_min, "freq_max": freq_max, "prominence_factor": prominence_factor,
+            "constrain_octave_start_note": constrain_octave_start_note,
+            "target_pitches": list(target_pitches) if target_pitches else None,
+            "pitch_classes": pitch_classes,
+            "decimate": decimate,
+            "interpolate": interpolate,
+            "gate_db": gate_db,
+            "gate_tail": gate_tail if gate_db is not None else None,
+        }
+        try:
+            with profiler.stage("cache_lookup"):
+                key = cache.key(audio_path, params)
+        except OSError as e:
+            print(f"Error loading audio file: {e}")
+            return []
+        # A hit has no spectrum to save, so a sidecar request always recomputes.
+        cached = cache.get(key) if not save_spectrum else None
+        if cached is not None:
+            return cached
+        prominent_notes_data = extract_prominent_frequencies(audio_path, streaming=streaming, block_frames=block_frames,
+                                                             save_spectrum=save_spectrum, stft_workers=stft_workers,
+                                                             profiler=profiler, use_numba=use_numba, **params)
+        if prominent_notes_data:
+            cache.put(key, prominent_notes_data)
+        return prominent_notes_data
+
+    if target_pitches:
+        try:
+            return measure_target_pitches(audio_path, target_pitches, top_n=top_n, frame_size=frame_size,
+                                          hop_length=hop_length, sr=sr, prominence_factor=prominence_factor,
+                                          block_frames=block_frames)
+        except Exception as e:
+            print(f"Error loading audio file: {e}")
+            return []
+
     try:
-        y, sr = librosa.load(audio_path, sr=sr)
+        if streaming:
+            native_sr = native_sample_rate(audio_path)
+        else:
+            with profiler.stage("decode"):
+                y, native_sr = load_audio(audio_path)
+        sr = sr or native_sr
+
+        decimation_factor = 1
+        if decimate:
+            decimation_factor = choose_decimation_factor(sr, frame_size, hop_length, freq_max)
+            sr //= decimation_factor
+            frame_size //= decimation_factor
+            hop_length //= decimation_factor
+
+        if streaming:
+            # Decoding and resampling happen block by block inside the averaging loop.
+            sr, blocks = open_audio_stream(audio_path, sr=sr, block_length=block_frames * hop_length)
+        elif sr != native_sr:
+            # Same filter librosa.load(sr=...) applies, going straight to the (decimated) rate.
+            with profiler.stage("resample"):
+                y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type='soxr_hq')
     except Exception as e:
         print(f"Error loading audio file: {e}")
         return []
 
-    D = librosa.stft(y, n_fft=frame_size, hop_length=hop_length)
-    magnitude_spectrogram = np.abs(D)
-    frequencies = librosa.fft_frequencies(sr=sr, n_fft=frame_size)
+    plan = get_analysis_plan(sr, frame_size=frame_size, hop_length=hop_length, freq_min=freq_min,
+                             freq_max=freq_max, constrain_octave_start_note=constrain_octave_start_note)
+    if plan.band_frequencies.size == 0:
+        print("No frequencies found within the specified Hz range.")
+        return []
+
+    if gate_db is not None:
+        gate = EnergyGate(gate_db, tail_frames=int(round(gate_tail * sr / hop_length)))
+        try:
+            if streaming:
+                frame_blocks = iter_stft_frames(profiler.iterate("decode", blocks), frame_size, hop_length)
+            else:
+                frames = plan.centered_frames(y)
+                frame_blocks = (frames[i:i + 256] for i in range(0, len(frames), 256))
+            average_spectrum = plan.gated_average_spectrum(frame_blocks, gate, profiler=profiler)
+        except Exception as e:
+            print(f"Error loading audio file: {e}")
+            return []
+    elif streaming:
+        try:
+            average_spectrum = plan.stream_average_spectrum(blocks, profiler=profiler)
+        except Exception as e:
+            print(f"Error loading audio file: {e}")
+            return []
+    elif stft_workers != 1:
+        average_spectrum = plan.parallel_average_spectrum(y, workers=stft_workers, profiler=profiler)
+    elif use_numba:
+        average_spectrum = plan.fused_average_spectrum(y, full_band=bool(save_spectrum) or interpolate,
+                                                       profiler=profiler)
+    else:
+        average_spectrum = plan.average_spectrum(y, profiler=profiler)
+    # A frame_size / q window sums q times fewer samples; rescale to full-rate magnitudes.
+    if decimation_factor > 1:
+        average_spectrum = average_spectrum * np.float32(decimation_factor)
+
+    if save_spectrum:
+        try:
+            save_spectrum_sidecar(save_spectrum, average_spectrum, sr, frame_size, hop_length)
+        except Exception as e:
+            print(f"Error saving spectrum file: {e}")
 
-    valid_freq_indices = np.where((frequencies >= freq_min) & (frequencies <= freq_max))[0]
-    filtered_frequencies = frequencies[valid_freq_indices]
-    filtered_magnitude_spectrogram = magnitude_spectrogram[valid_freq_indices, :]
+    if pitch_classes:
+        return plan.pick_pitch_classes(average_spectrum, resolution=pitch_classes, top_n=top_n,
+                                       prominence_factor=prominence_factor, profiler=profiler)
+    return plan.pick_notes(average_spectrum, top_n=top_n, prominence_factor=prominence_factor,
+                           interpolate=interpolate, use_numba=use_numba, profiler=profiler)
 
-    if filtered_frequencies.size == 0:
+
+def extract_channel_frequencies(audio_path, top_n=12, frame_size=2048, hop_length=512, sr=None, freq_min=20,
+                                freq_max=20000, prominence_factor=0.2, constrain_octave_start_note=None,
+                                interpolate=False, profiler=None):
+    """
+    Multi-microphone version of extract_prominent_frequencies: analyses every
+    channel of a multi-channel recording with one batched STFT instead of
+    downmixing, so several mic positions cost about as much as one.
+
+    The combined list is picked from the mean of the channel spectra. Unlike a
+    downmix, this cannot lose a partial to phase cancellation between mics.
+
+    Args:
+        audio_path (str): Path to a (multi-channel) audio file.
+        Other arguments as for extract_prominent_frequencies.
+    Returns:
+        dict: {'channels': one (note_name, magnitude, frequency) list per channel,
+               'combined': the same for all channels together}, or None if the
+              file could not be loaded or the band is empty.
+    """
+    profiler = profiler or NO_PROFILER
+    try:
+        with profiler.stage("decode"):
+            y, native_sr = load_audio_channels(audio_path)
+        sr = sr or native_sr
+        if sr != native_sr:
+            with profiler.stage("resample"):
+                y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type='soxr_hq')
+    except Exception as e:
+        print(f"Error loading audio file: {e}")
+        return None
+
+    plan = get_analysis_plan(sr, frame_size=frame_size, hop_length=hop_length, freq_min=freq_min,
+                             freq_max=freq_max, constrain_octave_start_note=constrain_octave_start_note)
+    if plan.band_frequencies.size == 0:
         print("No frequencies found within the specified Hz range.")
-        return []
+        return None
+
+    spectra = plan.channel_spectra(y, profiler=profiler)
+    pick = functools.partial(plan.pick_notes, top_n=top_n, prominence_factor=prominence_factor,
+                             interpolate=interpolate, profiler=profiler)
+    return {
+        "channels": [pick(spectrum) for spectrum in spectra],
+        "combined": pick(spectra.mean(axis=0)),
+    }
+
+
+def pick_peaks_2d(spectra, top_n=12, prominence_factor=0.2):
+    """
+    Vectorized peak picking over many spectra at once (one per row).
+
+    A bin is a peak if it is greater than its lower neighbour, at least its upper
+    neighbour and at least prominence_factor times its row's maximum. The height
+    threshold stands in for find_peaks' prominence, which needs a per-peak search.
+    The top_n peaks of every row are selected with one argpartition.
+
+    Args:
+        spectra (np.ndarray): (n_rows, n_bins) magnitudes.
+    Returns:
+        tuple: (rows, bins, magnitudes) arrays of the selected peaks, each row's
+               peaks loudest first.
+    """
+    n_rows, n_bins = spectra.shape
+    if n_rows == 0 or n_bins < 3 or top_n <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=spectra.dtype)
+
+    centre = spectra[:, 1:-1]
+    is_peak = ((centre > spectra[:, :-2]) & (centre >= spectra[:, 2:])
+               & (centre >= prominence_factor * spectra.max(axis=1, keepdims=True)))
+    scores = np.where(is_peak, centre, -np.inf)
+
+    k = min(top_n, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    rows, ranks = np.nonzero(np.isfinite(candidate_scores))
+    return rows, candidates[rows, ranks] + 1, candidate_scores[rows, ranks]
+
+
+def iter_window_spectra(blocks, plan, window_frames):
+    """
+    Streams blocks of samples through plan's STFT and yields the mean in-band
+    magnitude spectrum of every window_frames consecutive frames. Complete
+    windows come out as soon as their frames are in; a final partial window is
+    averaged over the frames it has.
+
+    Yields:
+        np.ndarray: float32 (n_windows, n_band_bins) window means, in order.
+    """
+    pending = np.zeros((0, plan.band_frequencies.size), dtype=np.float32)
+    for frames in iter_stft_frames(blocks, plan.frame_size, plan.hop_length):
+        magnitudes = plan.frame_magnitudes(frames)[:, plan.bin_slice].astype(np.float32)
+        pending = np.concatenate([pending, magnitudes])
+        n_windows = len(pending) // window_frames
+        if n_windows:
+            complete = pending[:n_windows * window_frames]
+            yield complete.reshape(n_windows, window_frames, -1).mean(axis=1)
+            pending = pending[n_windows * window_frames:]
+    if len(pending):
+        yield pending.mean(axis=0, keepdims=True)
+
+
+def track_prominent_notes(audio_path, window_seconds=1.0, top_n=12, frame_size=2048, hop_length=512, sr=None,
+                          freq_min=20, freq_max=20000, prominence_factor=0.2, constrain_octave_start_note=None,
+                          block_frames=64, rows_per_batch=256):
+    """
+    Time-resolved version of extract_prominent_frequencies: the top-N notes of
+    every window_seconds-long window instead of one list for the whole file.
+
+    The file is streamed block by block; frame magnitudes are averaged per
+    window by iter_window_spectra, and completed windows are peak-picked rows_per_batch at a time with
+    pick_peaks_2d, so memory stays bounded for hours of audio.
+
+    Returns:
+        dict: Columnar tracks, one entry per (window, note):
+              'time' (float64 window start, s), 'midi' (int16), 'magnitude' (float32),
+              'frequency' (float32), plus 'note_names' (MIDI -> name table),
+              'window_seconds' and 'sr'.
+    """
+    sr, blocks = open_audio_stream(audio_path, sr=sr, block_length=block_frames * hop_length)
+    plan = get_analysis_plan(sr, frame_size=frame_size, hop_length=hop_length, freq_min=freq_min,
+                             freq_max=freq_max, constrain_octave_start_note=constrain_octave_start_note)
+    window_frames = max(1, int(round(window_seconds * sr / hop_length)))
+    columns = {"time": [], "midi": [], "magnitude": [], "frequency": []}
+    pending_rows = []
+    n_rows_done = 0
+
+    def flush_rows():
+        nonlocal n_rows_done, pending_rows
+        if not pending_rows:
+            return
+        spectra = np.vstack(pending_rows)
+        rows, bins, magnitudes = pick_peaks_2d(spectra, top_n=top_n, prominence_factor=prominence_factor)
+        midi = plan.bin_midi[bins]
+        has_note = (midi >= 0) & (midi <= 127)
+        rows, bins, magnitudes, midi = rows[has_note], bins[has_note], magnitudes[has_note], midi[has_note]
+        columns["time"].append((n_rows_done + rows) * window_frames * hop_length / sr)
+        columns["midi"].append(midi.astype(np.int16))
+        columns["magnitude"].append(magnitudes.astype(np.float32))
+        columns["frequency"].append(plan.band_frequencies[bins].astype(np.float32))
+        n_rows_done += len(spectra)
+        pending_rows = []
+
+    for window_means in iter_window_spectra(blocks, plan, window_frames):
+        pending_rows.append(window_means)
+        if sum(len(r) for r in pending_rows) >= rows_per_batch:
+            flush_rows()
+    flush_rows()
+
+    dtypes = {"time": np.float64, "midi": np.int16, "magnitude": np.float32, "frequency": np.float32}
+    tracks = {name: np.concatenate(parts) if parts else np.zeros(0, dtype=dtypes[name])
+              for name, parts in columns.items()}
+    tracks["note_names"] = np.array(plan.note_names.tolist(), dtype=str)
+    tracks["window_seconds"] = window_frames * hop_length / sr
+    tracks["sr"] = sr
+    return tracks
+
+
+def save_note_tracks(path, tracks):
+    """Writes track_prominent_notes() output to a compressed columnar .npz."""
+    np.savez_compressed(path, **tracks)
+
 
-    average_spectrum = np.mean(filtered_magnitude_spectrogram, axis=1)
-    prominence_threshold = prominence_factor * np.max(average_spectrum)
-    peaks, properties = find_peaks(average_spectrum, prominence=prominence_threshold)
+# File types picked up when a batch is given a directory.
+AUDIO_EXTENSIONS = (".wav", ".mp4", ".m4a", ".mp3", ".flac", ".ogg", ".aif", ".aiff")
 
-    all_found_notes_data = []
-    target_constrain_midi_start = None
-    if constrain_octave_start_note:
-        target_constrain_midi_start = librosa.note_to_midi(constrain_octave_start_note)
-        if target_constrain_midi_start is None:
-            print(f"Warning: Could not convert '{constrain_octave_start_note}' to MIDI for octave constraint. Constraint will be ignored.")
 
+def find_audio_files(path_or_glob, extensions=AUDIO_EXTENSIONS):
+    """
+    Expands a directory (searched recursively for the given extensions), a glob
+    pattern or a single file into a sorted list of audio file paths.
+    """
+    if os.path.isdir(path_or_glob):
+        matches = glob.glob(os.path.join(path_or_glob, "**", "*"), recursive=True)
+        return sorted(p for p in matches if os.path.isfile(p) and p.lower().endswith(tuple(extensions)))
+    return sorted(p for p in glob.glob(path_or_glob, recursive=True) if os.path.isfile(p))
 
-    for p_idx in peaks:
-        original_freq = filtered_frequencies[p_idx]
-        midi_note_float = freq_to_midi(original_freq)
-        midi_note_int = int(round(midi_note_float))
 
-        # Apply octave constraint here if requested
-        constrained_midi_note = midi_note_int
-        if constrain_octave_start_note and target_constrain_midi_start is not None:
-             constrained_midi_note = constrain_midi_to_octave(midi_note_int, target_constrain_midi_start)
+def analyze_file_record(audio_path, params, profile=False):
+    """
+    Analyzes one file and returns a JSON-serialisable record for batch output:
+    path, notes, magnitudes, frequencies and timings. With profile, timings also
+    holds the wall time of each stage and the record gains the full 'profile'.
+    """
+    start = time.perf_counter()
+    profiler = StageProfiler() if profile else None
+    # Keep the analysis diagnostics off stdout, which carries the JSON Lines stream.
+    with contextlib.redirect_stdout(sys.stderr):
+        prominent_notes_data = extract_prominent_frequencies(audio_path, profiler=profiler, **params)
+    record = {
+        "path": audio_path,
+        "notes": [item[0] for item in prominent_notes_data],
+        "magnitudes": [float(item[1]) for item in prominent_notes_data],
+        "frequencies": [float(item[2]) for item in prominent_notes_data],
+        "timings": {"total_s": time.perf_counter() - start},
+    }
+    if profiler:
+        record["profile"] = profiler.report()
+        for name, stage in record["profile"]["stages"].items():
+            record["timings"][f"{name}_s"] = stage["wall_s"]
+    return record
 
-        # Convert to note name AFTER constraining
-        note_name = midi_to_note_name(constrained_midi_note)
-        mag = average_spectrum[p_idx]
 
-        if note_name: # Only add if note_name conversion was successful
-            all_found_notes_data.append((note_name, mag, original_freq))
+def analyze_batch(audio_paths, workers=None, profile=False, **params):
+    """
+    Analyzes many files across a process pool.
 
-    # Sort by magnitude (loudest first), then take top_n
-    all_found_notes_data.sort(key=lambda x: x[1], reverse=True)
-    top_notes_by_magnitude = all_found_notes_data[:top_n]
+    Args:
+        audio_paths (list): Files to analyze.
+        workers (int, optional): Number of worker processes (default: os.cpu_count()).
+                                 1 runs everything in this process.
+        profile (bool): Add per-stage timings and memory to each record.
+        **params: Passed to extract_prominent_frequencies.
+    Yields:
+        dict: One analyze_file_record() per file, in completion order, or
+              {'path', 'error'} for a file whose analysis raised.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for audio_path in audio_paths:
+            # Same as the pool below: a failing file becomes an error record, not the end of the batch.
+            try:
+                record = analyze_file_record(audio_path, params, profile)
+            except Exception as e:
+                record = {"path": audio_path, "error": str(e)}
+            yield record
+        return
 
-    # # Finally, sort the top N by pitch (MIDI value derived from note_name)
-    # top_notes_by_magnitude.sort(key=lambda x: librosa.note_to_midi(x[0]), reverse=False)
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(audio_paths), 1))) as pool:
+        futures = {pool.submit(analyze_file_record, audio_path, params, profile): audio_path for audio_path in audio_paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {"path": futures[future], "error": str(e)}
 
-    return top_notes_by_magnitude
+
+# Request keys accepted by the worker, forwarded to extract_prominent_frequencies.
+WORKER_ANALYSIS_KEYS = ("top_n", "frame_size", "hop_length", "sr", "freq_min", "freq_max",
+                        "prominence_factor", "constrain_octave_start_note", "streaming", "block_frames",
+                        "save_spectrum", "target_pitches", "pitch_classes", "decimate",
+                        "stft_workers", "interpolate", "gate_db", "gate_tail", "use_numba")
+
+
+def save_note_names_json(note_names_list, output_json):
+    """Writes the note name list to output_json, the file read by generate_lilypond.js."""
+    with open(output_json, 'w') as f:
+        json.dump(note_names_list, f, indent=4)
+
+
+def warm_up_analysis(use_numba=False):
+    """
+    Runs one analysis on a short synthetic tone so that librosa's lazily loaded
+    submodules, the audio backends and any numba-compiled helpers are ready
+    before the first real request arrives.
+    """
+    import soundfile as sf
+
+    sr = 22050
+    t = np.arange(sr // 2) / sr
+    tone = (0.5 * np.sin(2 * np.pi * 440.0 * t)).astype(np.float32)
+    fd, warm_up_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        sf.write(warm_up_path, tone, sr)
+        with contextlib.redirect_stdout(sys.stderr):
+            extract_prominent_frequencies(warm_up_path, constrain_octave_start_note="C4", use_numba=use_numba)
+    finally:
+        os.remove(warm_up_path)
+
+
+def handle_worker_request(request, defaults):
+    """
+    Handles one worker request and returns the response dict.
+
+    Args:
+        request (dict): Must contain 'audio_file'. May contain 'id', 'output_json',
+                        'profile' (true adds a StageProfiler report to the response),
+                        'multichannel' (true analyses each channel, see
+                        extract_channel_frequencies; 'notes' are then the combined notes)
+                        and any of WORKER_ANALYSIS_KEYS to override the defaults.
+        defaults (dict): Analysis parameters taken from the worker's command line.
+    Returns:
+        dict: {'id', 'notes'[, 'channels'][, 'profile']} on success, {'id', 'error'} on failure.
+    """
+    response = {"id": request.get("id")}
+    audio_file = request.get("audio_file")
+    if not audio_file:
+        response["error"] = "Request is missing 'audio_file'."
+        return response
+
+    params = dict(defaults)
+    params.update({key: request[key] for key in WORKER_ANALYSIS_KEYS if key in request})
+
+    profiler = StageProfiler() if request.get("profile") else None
+    # The analysis prints its diagnostics; keep stdout clean for the JSON protocol.
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if request.get("multichannel"):
+                channel_params = {key: params[key] for key in
+                                  ("top_n", "frame_size", "hop_length", "sr", "freq_min", "freq_max",
+                                   "prominence_factor", "constrain_octave_start_note", "interpolate") if key in params}
+                channel_results = extract_channel_frequencies(audio_file, profiler=profiler, **channel_params)
+                if channel_results is None:
+                    response["error"] = f"Could not analyse '{audio_file}'."
+                    return response
+                response["channels"] = [[item[0] for item in notes] for notes in channel_results["channels"]]
+                prominent_notes_data = channel_results["combined"]
+            else:
+                prominent_notes_data = extract_prominent_frequencies(audio_file, profiler=profiler, **params)
+    except Exception as e:
+        response["error"] = f"Error analysing '{audio_file}': {e}"
+        return response
+    note_names_list = [item[0] for item in prominent_notes_data]
+
+    output_json = request.get("output_json")
+    if output_json:
+        try:
+            save_note_names_json(note_names_list, output_json)
+        except Exception as e:
+            response["error"] = f"Error saving JSON to file: {e}"
+            return response
+
+    response["notes"] = note_names_list
+    if profiler:
+        response["profile"] = profiler.report()
+    return response
+
+
+def serve_analysis_requests(defaults, input_stream=None, output_stream=None):
+    """
+    Long-lived worker loop: reads one JSON request per line from input_stream and
+    writes one JSON response per line to output_stream, so the interpreter start
+    and the librosa/numba/scipy imports are paid once instead of on every cycle.
+
+    A line '{"audio_file": "recorded_audio.wav", "output_json": "notes.json"}'
+    is answered with '{"id": null, "notes": ["C4", ...]}'.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    warm_up_analysis(use_numba=defaults.get("use_numba", False))
+    output_stream.write(json.dumps({"ready": True}) + "\n")
+    output_stream.flush()
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            # Read the id first so even a failing request is answered under its own id.
+            request_id = request.get("id") if isinstance(request, dict) else None
+            response = handle_worker_request(request, defaults)
+        except Exception as e:
+            response = {"id": request_id, "error": f"Invalid request: {e}"}
+        output_stream.write(json.dumps(response) + "\n")
+        output_stream.flush()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract prominent frequencies, convert to MIDI, constrain octave, and output as JSON note names.")
-    parser.add_argument("audio_file", help="Path to the input audio file.")
+    parser.add_argument("audio_file", nargs="?",
+                        help="Path to the input audio file, a .npz spectrum saved with --save_spectrum "
+                             "(re-peaks without decoding), or a directory / glob pattern with --batch.")
     parser.add_argument("-n", "--top_n", type=int, default=12,
                         help="Number of most prominent MIDI notes to extract (default: 12).")
     parser.add_argument("--frame_size", type=int, default=2048,
@@ -147,33 +1793,194 @@ if __name__ == "__main__":
     parser.add_argument("--prominence_factor", type=float, default=0.05,
                         help="Factor for peak prominence threshold (default: 0.01).")
     parser.add_argument("-o", "--output_json", type=str,
-                        help="Optional: Path to output JSON file. If not provided, output to console.")
+                        help="Optional: Path to output JSON file (JSON Lines with --batch). If not provided, output to console.")
     parser.add_argument("--constrain_octave_start_note", type=str, default=None,
                         help="Optional: Constrain notes to the octave starting at this note (e.g., 'C4' for C4-B4).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read the audio in blocks and average the spectrum incrementally (memory independent of file length).")
+    parser.add_argument("--block_frames", type=int, default=64,
+                        help="Hops read per block in --stream mode (default: 64).")
+    parser.add_argument("--targets", type=str, default=None,
+                        help="Comma-separated note names or frequencies (e.g. 'C4,E4,G4,440') to measure instead of "
+                             "searching the whole spectrum; returns the ranked targets that are present.")
+    parser.add_argument("--gate_db", type=float, default=None,
+                        help="Skip frames quieter than this RMS level in dBFS (e.g. -50) before the STFT and averaging.")
+    parser.add_argument("--gate_tail", type=float, default=0.5,
+                        help="Seconds kept after each frame above --gate_db, so bell decays are included (default: 0.5).")
+    parser.add_argument("--interpolate", action="store_true",
+                        help="Refine peak frequencies between FFT bins (parabolic fit) before converting them to notes.")
+    parser.add_argument("--stft_workers", type=int, default=1,
+                        help="Threads used to compute the STFT of one long file in overlapping chunks (0 = all cores, default: 1).")
+    parser.add_argument("--decimate", action="store_true",
+                        help="Resample to the lowest rate covering --freq_max before the STFT (same bins, less work).")
+    parser.add_argument("--pitch_classes", type=int, choices=(12, 24, 36), default=None,
+                        help="Fold the spectral peaks into 12/24/36 pitch classes per octave and rank the classes "
+                             "(named in the --constrain_octave_start_note octave, C4 by default).")
+    parser.add_argument("--save_spectrum", nargs="?", const=True, default=None,
+                        help="Save the average spectrum to a .npz sidecar (default path: <audio>.spectrum.npz) "
+                             "so thresholds can be re-tuned later by passing the sidecar as audio_file.")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", default=None,
+                        help="Always re-analyse instead of reusing cached results for identical files and parameters.")
+    parser.add_argument("--cache", dest="use_cache", action="store_true",
+                        help="Cache results in --serve mode too. Off there by default: a live recording changes "
+                             "every cycle, so its entries would never be reused.")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help=f"Directory for cached analysis results (default: {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--cache_max_mb", type=float, default=256,
+                        help="Size cap of the result cache in MB; least recently used entries are evicted (default: 256).")
+    parser.add_argument("--batch", action="store_true",
+                        help="Treat audio_file as a directory or glob and analyze every file in a process pool, writing one JSON line per file.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --batch (default: number of CPU cores).")
+    parser.add_argument("--tracks", type=str, default=None,
+                        help="Write time-resolved note tracks (time, midi, magnitude, frequency columns) to this .npz "
+                             "instead of one note list for the whole file.")
+    parser.add_argument("--track_window", type=float, default=1.0,
+                        help="Window length in seconds for --tracks (default: 1).")
+    parser.add_argument("--numba", dest="use_numba", action="store_true",
+                        help="Average the spectrum and pick peaks with numba-compiled kernels (same notes; "
+                             "compiled once and cached on disk; ignored if numba is not installed).")
+    parser.add_argument("--multichannel", action="store_true",
+                        help="Analyse each channel of a multi-microphone recording separately (one batched STFT) "
+                             "and report per-channel and combined notes; -o receives the combined notes and "
+                             "<output_json stem>.channels.json the per-channel lists.")
+    parser.add_argument("--live", action="store_true",
+                        help="Read raw PCM from stdin (e.g. ffmpeg ... -f f32le -) and emit the rolling top-N notes as JSON lines.")
+    parser.add_argument("--pcm_format", choices=sorted(PCM_FORMATS), default="f32le",
+                        help="Sample format of the --live PCM stream (default: f32le).")
+    parser.add_argument("--channels", type=int, default=1,
+                        help="Interleaved channels in the --live PCM stream, downmixed to mono (default: 1).")
+    parser.add_argument("--window_seconds", type=float, default=5.0,
+                        help="Length of the rolling analysis window in --live mode (default: 5).")
+    parser.add_argument("--emit_interval", type=float, default=1.0,
+                        help="Seconds of audio between --live results (default: 1).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Report wall time and peak memory per stage (decode, resample, stft, averaging, "
+                             "peak_picking, note_conversion); written to <output_json stem>.profile.json with -o, "
+                             "otherwise printed. With --batch each record gets per-stage timings.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a persistent worker reading JSON line requests on stdin and writing JSON line responses to stdout.")
 
 
     args = parser.parse_args()
 
+    analysis_params = {
+        "top_n": args.top_n,
+        "frame_size": args.frame_size,
+        "hop_length": args.hop_length,
+        "sr": args.sr,
+        "freq_min": args.freq_min,
+        "freq_max": args.freq_max,
+        "prominence_factor": args.prominence_factor,
+        "constrain_octave_start_note": args.constrain_octave_start_note,
+        "streaming": args.stream,
+        "block_frames": args.block_frames,
+        "pitch_classes": args.pitch_classes,
+        "decimate": args.decimate,
+        "stft_workers": args.stft_workers,
+        "interpolate": args.interpolate,
+        "gate_db": args.gate_db,
+        "gate_tail": args.gate_tail,
+        "use_numba": args.use_numba,
+        "target_pitches": [t for t in args.targets.split(",") if t.strip()] if args.targets else None,
+        "cache": (AnalysisCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+                  if (args.use_cache if args.use_cache is not None else not args.serve) else None),
+    }
+
+    if args.serve:
+        serve_analysis_requests(analysis_params)
+        sys.exit(0)
+
+    if args.live:
+        live_params = {key: analysis_params[key] for key in
+                       ("top_n", "frame_size", "hop_length", "freq_min", "freq_max",
+                        "prominence_factor", "constrain_octave_start_note")}
+        try:
+            for record in live_prominent_notes(sys.stdin.buffer, sr=args.sr or 48000, pcm_format=args.pcm_format,
+                                               channels=args.channels, window_seconds=args.window_seconds,
+                                               emit_interval=args.emit_interval, **live_params):
+                print(json.dumps(record), flush=True)
+                if args.output_json:
+                    save_note_names_json(record["notes"], args.output_json)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if not args.audio_file:
+        parser.error("audio_file is required unless --serve or --live is given.")
+
+    if args.save_spectrum is True:
+        args.save_spectrum = spectrum_sidecar_path(args.audio_file)
+    if args.batch and args.save_spectrum:
+        parser.error("--save_spectrum takes a single audio file, not --batch.")
+    analysis_params["save_spectrum"] = args.save_spectrum
+
+    if args.batch:
+        audio_paths = find_audio_files(args.audio_file)
+        if not audio_paths:
+            print(f"No audio files found for '{args.audio_file}'.", file=sys.stderr)
+            sys.exit(1)
+        out = open(args.output_json, 'w') if args.output_json else sys.stdout
+        try:
+            for record in analyze_batch(audio_paths, workers=args.workers, profile=args.profile, **analysis_params):
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        sys.exit(0)
+
+    if args.tracks:
+        try:
+            tracks = track_prominent_notes(args.audio_file, window_seconds=args.track_window, top_n=args.top_n,
+                                           frame_size=args.frame_size, hop_length=args.hop_length, sr=args.sr,
+                                           freq_min=args.freq_min, freq_max=args.freq_max,
+                                           prominence_factor=args.prominence_factor,
+                                           constrain_octave_start_note=args.constrain_octave_start_note,
+                                           block_frames=args.block_frames)
+            save_note_tracks(args.tracks, tracks)
+        except Exception as e:
+            print(f"Error computing note tracks: {e}")
+            sys.exit(1)
+        n_windows = len(np.unique(tracks["time"]))
+        print(f"{len(tracks['time'])} notes in {n_windows} windows of {tracks['window_seconds']:.3f}s saved to {args.tracks}")
+        sys.exit(0)
+
+    profiler = StageProfiler() if args.profile else None
+
+    if args.multichannel:
+        channel_results = extract_channel_frequencies(args.audio_file, top_n=args.top_n, frame_size=args.frame_size,
+                                                      hop_length=args.hop_length, sr=args.sr,
+                                                      freq_min=args.freq_min, freq_max=args.freq_max,
+                                                      prominence_factor=args.prominence_factor,
+                                                      constrain_octave_start_note=args.constrain_octave_start_note,
+                                                      interpolate=args.interpolate, profiler=profiler)
+        if channel_results is None:
+            sys.exit(1)
+        channel_note_names = [[item[0] for item in notes] for notes in channel_results["channels"]]
+        combined_note_names = [item[0] for item in channel_results["combined"]]
+        for channel, note_names in enumerate(channel_note_names):
+            print(f"Channel {channel + 1}: {json.dumps(note_names)}")
+        print(f"Combined: {json.dumps(combined_note_names)}")
+        if args.output_json:
+            save_note_names_json(combined_note_names, args.output_json)
+            channels_json = os.path.splitext(args.output_json)[0] + ".channels.json"
+            with open(channels_json, 'w') as f:
+                json.dump(channel_note_names, f, indent=4)
+            print(f"Combined notes saved to {args.output_json}, per-channel notes to {channels_json}")
+        if profiler:
+            print(json.dumps(profiler.report(), indent=4))
+        sys.exit(0)
+
     # Pass the prominence_factor to the extraction function
-    prominent_notes_data = extract_prominent_frequencies(
-        args.audio_file,
-        top_n=args.top_n,
-        frame_size=args.frame_size,
-        hop_length=args.hop_length,
-        sr=args.sr,
-        freq_min=args.freq_min,
-        freq_max=args.freq_max,
-        prominence_factor=args.prominence_factor,
-        constrain_octave_start_note=args.constrain_octave_start_note
-    )
+    prominent_notes_data = extract_prominent_frequencies(args.audio_file, profiler=profiler, **analysis_params)
 
     note_names_list = [item[0] for item in prominent_notes_data] # Extract just the note names
 
     if note_names_list:
         if args.output_json:
             try:
-                with open(args.output_json, 'w') as f:
-                    json.dump(note_names_list, f, indent=4)
+                save_note_names_json(note_names_list, args.output_json)
                 print(f"Note names successfully saved to {args.output_json}")
             except Exception as e:
                 print(f"Error saving JSON to file: {e}")
@@ -189,9 +1996,19 @@ if __name__ == "__main__":
         print("No prominent notes found within the specified range or audio file could not be processed.")
         if args.output_json:
             try:
-                with open(args.output_json, 'w') as f:
-                    json.dump([], f, indent=4)
+                save_note_names_json([], args.output_json)
                 print(f"Empty note list saved to {args.output_json}")
             except Exception as e:
                 print(f"Error saving empty JSON to file: {e}. Printing to console instead.")
-                print("[]")
\ No newline at end of file
+                print("[]")
+
+    if profiler:
+        profile_report = json.dumps(profiler.report(), indent=4)
+        if args.output_json:
+            profile_json = os.path.splitext(args.output_json)[0] + ".profile.json"
+            with open(profile_json, 'w') as f:
+                f.write(profile_report + "\n")
+            print(f"Stage profile saved to {profile_json}")
+        else:
+            print("\nStage profile:")
+            print(profile_report)
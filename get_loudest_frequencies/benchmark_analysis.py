@@ -0,0 +1,250 @@
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from analyze_audio import StageProfiler, extract_prominent_frequencies, freq_to_midi, midi_to_note_name
+
+# Partials of a tuned church bell relative to its prime (strike) tone, with their
+# relative amplitudes and decay times (s). The hum and prime ring longest and the
+# upper partials die away quickly, as in a real bell.
+BELL_PARTIALS = (
+    (0.5, 0.6, 4.0),    # hum
+    (1.0, 1.0, 3.0),    # prime
+    (1.2, 0.5, 2.0),    # tierce (minor third)
+    (1.5, 0.35, 1.5),   # quint
+    (2.0, 0.45, 1.2),   # nominal
+    (2.5, 0.2, 0.8),    # superquint
+    (2.67, 0.15, 0.6),  # octave nominal
+)
+
+# Primes of a ring of eight in C major, struck in rounds like the tower recordings.
+DEFAULT_BELL_PRIMES = ("C5", "B4", "A4", "G4", "F4", "E4", "D4", "C4")
+
+DEFAULT_DURATIONS = (5.0, 30.0, 120.0)
+DEFAULT_SAMPLE_RATES = (22050, 44100, 48000)
+DEFAULT_FRAME_SETTINGS = ((1024, 256), (2048, 512), (4096, 1024))
+
+
+def synthesize_bells(duration, sr, bell_primes=DEFAULT_BELL_PRIMES, strike_interval=0.25, seed=0):
+    """
+    Synthesizes bells struck in rounds: each bell is a sum of inharmonic partials
+    (BELL_PARTIALS) with exponential decays, struck with slightly random force and timing.
+
+    Args:
+        duration (float): Length of the signal in seconds.
+        sr (int): Sample rate.
+        bell_primes (tuple): Note names of the bells' prime tones, struck in this order.
+        strike_interval (float): Seconds between successive strikes.
+        seed (int): Seed for the strike force and timing jitter.
+    Returns:
+        np.ndarray: float32 mono signal peaking at 0.9.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(duration * sr)
+    y = np.zeros(n_samples, dtype=np.float64)
+
+    # One strike of each bell, rendered once and added at every strike time.
+    ring_seconds = max(decay for _, _, decay in BELL_PARTIALS) * 3
+    t = np.arange(int(ring_seconds * sr)) / sr
+    strikes = []
+    for note_name in bell_primes:
+        prime = float(librosa.note_to_hz(note_name))
+        strike = np.zeros_like(t)
+        for ratio, amplitude, decay in BELL_PARTIALS:
+            if prime * ratio < sr / 2:
+                strike += amplitude * np.exp(-t / decay) * np.sin(2 * np.pi * prime * ratio * t)
+        strikes.append(strike)
+
+    strike_time = 0.0
+    bell = 0
+    while strike_time < duration:
+        start = int(strike_time * sr)
+        length = min(len(t), n_samples - start)
+        y[start:start + length] += rng.uniform(0.7, 1.0) * strikes[bell][:length]
+        bell = (bell + 1) % len(strikes)
+        strike_time += strike_interval * rng.uniform(0.95, 1.05)
+
+    return (0.9 * y / np.max(np.abs(y))).astype(np.float32)
+
+
+def note_accuracy(prominent_notes_data, bell_primes=DEFAULT_BELL_PRIMES):
+    """
+    Scores detected notes against the bells' prime tones.
+
+    Returns:
+        dict: 'recall' (share of primes among the detected note names) and
+              'median_cents_error' (distance from each prime to the nearest
+              detected frequency).
+    """
+    detected_names = {item[0] for item in prominent_notes_data}
+    detected_freqs = np.array([float(item[2]) for item in prominent_notes_data])
+    expected_names = [midi_to_note_name(freq_to_midi(librosa.note_to_hz(n))) for n in bell_primes]
+    recall = sum(name in detected_names for name in expected_names) / len(expected_names)
+
+    cents_errors = []
+    if detected_freqs.size:
+        for note_name in bell_primes:
+            prime = float(librosa.note_to_hz(note_name))
+            cents_errors.append(float(np.min(np.abs(1200 * np.log2(detected_freqs / prime)))))
+    return {
+        "recall": recall,
+        "median_cents_error": statistics.median(cents_errors) if cents_errors else None,
+    }
+
+
+def run_case(audio_path, repeats, **params):
+    """
+    Times extract_prominent_frequencies on one file.
+
+    The timed runs are untraced; peak memory and the per-stage breakdown come
+    from one extra run each, since tracemalloc itself slows allocation down.
+
+    Returns:
+        dict: best/median wall time, peak traced memory, per-stage times and
+              the notes found, scored by note_accuracy().
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            prominent_notes_data = extract_prominent_frequencies(audio_path, **params)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(sys.stderr):
+        extract_prominent_frequencies(audio_path, **params)
+    peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+
+    profiler = StageProfiler()
+    with contextlib.redirect_stdout(sys.stderr):
+        extract_prominent_frequencies(audio_path, profiler=profiler, **params)
+    stages = profiler.report()["stages"]
+
+    return {
+        "best_s": min(times),
+        "median_s": statistics.median(times),
+        "peak_mb": peak_mb,
+        "stages_s": {name: stage["wall_s"] for name, stage in stages.items()},
+        "notes": [item[0] for item in prominent_notes_data],
+        **note_accuracy(prominent_notes_data),
+    }
+
+
+def run_benchmarks(durations=DEFAULT_DURATIONS, sample_rates=DEFAULT_SAMPLE_RATES,
+                   frame_settings=DEFAULT_FRAME_SETTINGS, repeats=3, **params):
+    """
+    Runs every combination of duration, sample rate and (frame_size, hop_length).
+
+    Each signal is written to a temporary WAV so that decoding is measured too.
+    The first run of the suite also pays librosa's lazy imports, so one untimed
+    warm-up analysis is done first.
+
+    Yields:
+        tuple: (case name, run_case() result)
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for duration in durations:
+            for sr in sample_rates:
+                audio_path = os.path.join(tmp_dir, f"bells_{duration:g}s_{sr}.wav")
+                sf.write(audio_path, synthesize_bells(duration, sr), sr, subtype="PCM_16")
+                with contextlib.redirect_stdout(sys.stderr):
+                    extract_prominent_frequencies(audio_path, **params)
+                for frame_size, hop_length in frame_settings:
+                    name = f"{duration:g}s/{sr}Hz/{frame_size}x{hop_length}"
+                    result = run_case(audio_path, repeats, frame_size=frame_size, hop_length=hop_length, **params)
+                    yield name, result
+                os.remove(audio_path)
+
+
+def compare_to_baseline(results, baseline, tolerance=0.1):
+    """
+    Prints the speed and memory ratio of each case to the baseline and flags
+    cases that got slower by more than tolerance or lost accuracy.
+
+    Returns:
+        int: Number of regressed cases.
+    """
+    regressions = 0
+    print(f"\n{'case':<28}{'time':>10}{'memory':>10}{'recall':>14}")
+    for name, result in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            print(f"{name:<28}{'(new)':>10}")
+            continue
+        time_ratio = result["best_s"] / base["best_s"]
+        memory_ratio = result["peak_mb"] / base["peak_mb"] if base["peak_mb"] else float("nan")
+        regressed = time_ratio > 1 + tolerance or result["recall"] < base["recall"]
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<28}{time_ratio:>9.2f}x{memory_ratio:>9.2f}x"
+              f"{base['recall']:>7.2f}->{result['recall']:.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark extract_prominent_frequencies on synthetic bell recordings.")
+    parser.add_argument("--durations", type=float, nargs="+", default=list(DEFAULT_DURATIONS),
+                        help="Signal lengths in seconds (default: 5 30 120).")
+    parser.add_argument("--sample_rates", type=int, nargs="+", default=list(DEFAULT_SAMPLE_RATES),
+                        help="Sample rates of the synthetic files (default: 22050 44100 48000).")
+    parser.add_argument("--frame_settings", type=str, nargs="+",
+                        default=[f"{f}x{h}" for f, h in DEFAULT_FRAME_SETTINGS],
+                        help="frame_size x hop_length pairs (default: 1024x256 2048x512 4096x1024).")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Runs per case; the fastest is reported (default: 3).")
+    parser.add_argument("--quick", action="store_true",
+                        help="Only the 5 s / 44100 Hz / 2048x512 case, for a fast smoke check.")
+    parser.add_argument("--stream", action="store_true", help="Benchmark the streaming path.")
+    parser.add_argument("--decimate", action="store_true", help="Benchmark with --decimate.")
+    parser.add_argument("--interpolate", action="store_true", help="Benchmark with --interpolate.")
+    parser.add_argument("--stft_workers", type=int, default=1, help="Threads for the STFT (default: 1).")
+    parser.add_argument("-o", "--output_json", type=str, default=None,
+                        help="Save the results as a baseline JSON file.")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Baseline JSON to compare against; exits non-zero on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed slowdown against the baseline before flagging (default: 0.1 = 10%%).")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.durations, args.sample_rates, args.frame_settings = [5.0], [44100], ["2048x512"]
+    frame_settings = [tuple(int(v) for v in setting.split("x")) for setting in args.frame_settings]
+    analysis_params = {
+        "constrain_octave_start_note": None,
+        "prominence_factor": 0.05,
+        "streaming": args.stream,
+        "decimate": args.decimate,
+        "interpolate": args.interpolate,
+        "stft_workers": args.stft_workers,
+    }
+
+    print(f"{'case':<28}{'best s':>10}{'median s':>10}{'peak MB':>10}{'recall':>8}{'cents':>8}")
+    results = {}
+    for name, result in run_benchmarks(args.durations, args.sample_rates, frame_settings,
+                                       repeats=args.repeats, **analysis_params):
+        results[name] = result
+        cents = result["median_cents_error"]
+        print(f"{name:<28}{result['best_s']:>10.4f}{result['median_s']:>10.4f}{result['peak_mb']:>10.1f}"
+              f"{result['recall']:>8.2f}{cents if cents is not None else float('nan'):>8.1f}", flush=True)
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({"params": analysis_params, "cases": results}, f, indent=4)
+        print(f"\nBaseline saved to {args.output_json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_to_baseline(results, baseline, tolerance=args.tolerance):
+            sys.exit(1)
@@ -2,6 +2,7 @@ const express = require('express');
 const path = require('path');
 const { exec, spawn } = require('child_process');
 const fs = require('fs');
+const readline = require('readline');
 
 const args = process.argv.slice(2); // Get arguments after 'node server.js'
 const isTestMode = args.includes('test'); // run "npm start test" to use test mode!
@@ -63,6 +64,101 @@ if (process.platform === 'darwin') { // macOS
 }
 
 
+// --- Persistent analysis worker ---
+// analyze_audio.py --serve loads librosa/numba/scipy once and answers JSON line
+// requests, so each cycle no longer pays for interpreter start-up and imports.
+let analysisWorker = null;
+let analysisWorkerReady = null;
+let nextAnalysisRequestId = 1;
+const pendingAnalysisRequests = new Map();
+// A request the worker never answers is failed after this long, so the cycle carries on.
+const ANALYSIS_TIMEOUT_MS = 60000;
+// Per-stage profiling (tracemalloc) slows each analysis down; run with PROFILE_ANALYSIS=1 to log it.
+const PROFILE_ANALYSIS = process.env.PROFILE_ANALYSIS === '1';
+
+function startAnalysisWorker() {
+    const workerArgs = [path.join(__dirname, 'analyze_audio.py'), '--serve'];
+    console.log(`Starting analysis worker: ${PYTHON_PATH} ${workerArgs.join(' ')}`);
+    const worker = spawn(PYTHON_PATH, workerArgs, { cwd: __dirname });
+    analysisWorker = worker;
+    // Writing to a worker that has just died raises EPIPE here; the 'close' handler fails its requests.
+    worker.stdin.on('error', (err) => {
+        console.warn(`Analysis worker stdin error: ${err.message}`);
+    });
+
+    analysisWorkerReady = new Promise((resolve, reject) => {
+        const lines = readline.createInterface({ input: worker.stdout });
+        lines.on('line', (line) => {
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch (err) {
+                console.warn(`Analysis worker output: ${line}`);
+                return;
+            }
+            if (message.ready) {
+                console.log('Analysis worker ready.');
+                resolve();
+                return;
+            }
+            const pending = pendingAnalysisRequests.get(message.id);
+            if (!pending) {
+                return;
+            }
+            pendingAnalysisRequests.delete(message.id);
+            if (message.error) {
+                pending.reject(new Error(message.error));
+            } else {
+                pending.resolve(message);
+            }
+        });
+
+        worker.stderr.on('data', (data) => {
+            console.warn(`Analysis worker stderr: ${data.toString().trim()}`);
+        });
+
+        worker.on('error', (err) => {
+            console.error(`Failed to start analysis worker: ${err.message}`);
+            reject(err);
+        });
+
+        worker.on('close', (code) => {
+            console.warn(`Analysis worker exited with code ${code}.`);
+            if (analysisWorker === worker) {
+                analysisWorker = null;
+                analysisWorkerReady = null;
+            }
+            for (const pending of pendingAnalysisRequests.values()) {
+                pending.reject(new Error(`Analysis worker exited with code ${code}`));
+            }
+            pendingAnalysisRequests.clear();
+            reject(new Error(`Analysis worker exited with code ${code}`));
+        });
+    });
+    // Avoid an unhandled rejection if the worker dies before anyone awaits it.
+    analysisWorkerReady.catch(() => {});
+}
+
+async function requestAnalysis(params) {
+    if (!analysisWorker) {
+        startAnalysisWorker();
+    }
+    await analysisWorkerReady;
+
+    const id = nextAnalysisRequestId++;
+    return new Promise((resolve, reject) => {
+        const timer = setTimeout(() => {
+            pendingAnalysisRequests.delete(id);
+            reject(new Error(`Analysis request ${id} timed out after ${ANALYSIS_TIMEOUT_MS} ms`));
+        }, ANALYSIS_TIMEOUT_MS);
+        pendingAnalysisRequests.set(id, {
+            resolve: (message) => { clearTimeout(timer); resolve(message); },
+            reject: (err) => { clearTimeout(timer); reject(err); },
+        });
+        analysisWorker.stdin.write(JSON.stringify({ id, ...params }) + '\n');
+    });
+}
+
 function loadOrganData() {
     try {
         const data = fs.readFileSync(ORGAN_DATA_PATH, 'utf8');
@@ -187,21 +283,20 @@ async function processAudioAndGenerateSVG() {
         console.log(`Status: ${currentStatusMessage}`);
         console.log('Analyzing audio...');
 
-        const analyzeCommand = `${PYTHON_PATH} ${path.join(__dirname, 'analyze_audio.py')} ${AUDIO_FILE_PATH} --output_json ${NOTES_JSON_PATH} --constrain_octave_start_note C4`;
-        await new Promise((resolve, reject) => {
-            exec(analyzeCommand, { cwd: scriptDir }, (error, stdout, stderr) => {
-                if (error) {
-                    const errorMsg = `Audio analysis command failed: ${error.message}. Stderr: ${stderr.substring(0, 500)}...`;
-                    console.error(`Analysis failed: ${errorMsg}`);
-                    return reject(new Error(errorMsg));
-                }
-                if (stderr) {
-                    console.warn(`Analysis stderr: ${stderr}`);
-                }
-                console.log('Audio analysis complete.');
-                resolve();
-            });
+        const analysisStart = Date.now();
+        const analysisResult = await requestAnalysis({
+            audio_file: AUDIO_FILE_PATH,
+            output_json: NOTES_JSON_PATH,
+            constrain_octave_start_note: 'C4',
+            profile: PROFILE_ANALYSIS
         });
+        console.log(`Audio analysis complete in ${Date.now() - analysisStart} ms: ${JSON.stringify(analysisResult.notes)}`);
+        if (analysisResult.profile) {
+            const stageSummary = Object.entries(analysisResult.profile.stages)
+                .map(([name, stage]) => `${name} ${(stage.wall_s * 1000).toFixed(1)} ms / ${stage.peak_mb.toFixed(1)} MB`)
+                .join(', ');
+            console.log(`Analysis stages: ${stageSummary}`);
+        }
 
         console.log('Generating new LilyPond SVG...');
         const generateNodeCommand = `node generate_lilypond.js`;
@@ -310,5 +405,6 @@ app.listen(PORT, () => {
         fs.writeFileSync(initialCombinedSvgPath, blankSvg);
     }
     loadOrganData();
+    startAnalysisWorker(); // Warm up the analysis worker before the first recording
     startProcessingTimer(); // Start the first timer
 });
\ No newline at end of file
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import librosa
+import numpy as np
+
+from analyze_audio import find_audio_files, get_analysis_plan, iter_window_spectra, open_audio_stream
+
+# Bump when the profile layout or its parameters change so old indexes are rebuilt.
+TAKE_INDEX_VERSION = 4
+PROFILES_FILE = "profiles.npy"
+FILES_TABLE = "files.json"
+# Rows of the memory-mapped profiles converted to float32 and scored at once by a query.
+QUERY_CHUNK_ROWS = 1 << 16
+
+# The video takes are camera recordings; their audio is in the mp4 container.
+TAKE_EXTENSIONS = (".mp4", ".m4a")
+
+DEFAULT_INDEX_PARAMS = {
+    "window_seconds": 2.0,
+    "sr": 22050,
+    "frame_size": 4096,
+    "hop_length": 1024,
+    "freq_min": 50,
+    "freq_max": 5000,
+    "prominence_factor": 0.05,
+}
+
+
+def window_frame_count(window_seconds, sr, hop_length):
+    """Number of STFT hops in one index window: window_seconds rounded to whole hops."""
+    return max(1, int(round(window_seconds * sr / hop_length)))
+
+
+def effective_window_seconds(window_seconds=2.0, sr=22050, hop_length=1024, **params):
+    """
+    Real length of one index window in seconds, window_frame_count hops long
+    (e.g. 43 * 1024 / 22050 = 1.99692 s for a nominal 2 s), which hit times
+    must be counted in so they do not drift over a long take.
+    """
+    return window_frame_count(window_seconds, sr, hop_length) * hop_length / sr
+
+
+def pitch_class_profiles(audio_path, window_seconds=2.0, sr=22050, frame_size=4096, hop_length=1024,
+                         freq_min=50, freq_max=5000, prominence_factor=0.05, block_frames=64):
+    """
+    Streams a file and folds the peaks of the mean spectrum of every
+    window_seconds-long window onto the 12 pitch classes (C, C♯, ..., B) with
+    AnalysisPlan.fold_pitch_classes, the fold of analyze_audio.py --pitch_classes 12.
+
+    Returns:
+        np.ndarray: float32 (n_windows, 12) profiles, each row scaled to unit
+                    length (all-zero rows for silent windows).
+    """
+    sr, blocks = open_audio_stream(audio_path, sr=sr, block_length=block_frames * hop_length)
+    plan = get_analysis_plan(sr, frame_size=frame_size, hop_length=hop_length, freq_min=freq_min,
+                             freq_max=freq_max, constrain_octave_start_note="C4")
+    window_frames = window_frame_count(window_seconds, sr, hop_length)
+
+    window_means = list(iter_window_spectra(blocks, plan, window_frames))
+    if not window_means:
+        return np.zeros((0, 12), dtype=np.float32)
+
+    profiles = plan.fold_pitch_classes(np.vstack(window_means), 12, prominence_factor)
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    return np.divide(profiles, norms, out=np.zeros_like(profiles), where=norms > 0)
+
+
+def parse_note_set(note_set):
+    """
+    Turns a note set such as "C,E,G", "C4 E4 G4" or "F♯,A,C♯" into a unit-length
+    12-bin pitch-class profile with equal weight on each named class (octaves are ignored).
+    """
+    profile = np.zeros(12, dtype=np.float32)
+    for note in note_set.replace(",", " ").split():
+        name = note.rstrip("0123456789-")
+        profile[librosa.note_to_midi(name + "4") % 12] = 1.0
+    if not profile.any():
+        raise ValueError(f"No notes found in '{note_set}'.")
+    return profile / np.linalg.norm(profile)
+
+
+class TakeIndex:
+    """
+    On-disk index of per-window pitch-class profiles of many takes.
+
+    The index directory holds profiles.npy, one float16 (n_windows, 12) array of
+    every take's windows back to back (opened memory-mapped and scored
+    QUERY_CHUNK_ROWS rows at a time, so a query never holds the whole array in
+    memory), and files.json, the table of each take's path,
+    size, mtime, first row ('offset') and number of windows, plus the analysis
+    parameters and the effective window length ('window_seconds', rounded to
+    whole hops) that hit times are counted in.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, FILES_TABLE)) as f:
+            table = json.load(f)
+        if table.get("version") != TAKE_INDEX_VERSION:
+            raise ValueError(f"Index in '{index_dir}' has version {table.get('version')}, "
+                             f"expected {TAKE_INDEX_VERSION}; rebuild it.")
+        self.params = table["params"]
+        self.window_seconds = table["window_seconds"]
+        self.files = table["files"]
+        self.profiles = np.load(os.path.join(index_dir, PROFILES_FILE), mmap_mode='r')
+        # Row -> file lookup for ranking results.
+        self.row_file = np.zeros(len(self.profiles), dtype=np.int32)
+        for file_index, entry in enumerate(self.files):
+            self.row_file[entry["offset"]:entry["offset"] + entry["n_windows"]] = file_index
+
+    @staticmethod
+    def build(index_dir, audio_paths, verbose=True, **params):
+        """
+        Writes an index of audio_paths to index_dir. Takes whose size and mtime
+        match an entry of an existing index there are copied instead of re-analysed.
+
+        Args:
+            index_dir (str): Directory to write (created if missing).
+            audio_paths (list): Files to index.
+            verbose (bool): Print one progress line per file to stderr.
+            **params: Overrides of DEFAULT_INDEX_PARAMS.
+        Returns:
+            TakeIndex: The new index.
+        """
+        params = {**DEFAULT_INDEX_PARAMS, **params}
+        previous = {}
+        try:
+            old = TakeIndex(index_dir)
+            if old.params == params:
+                previous = {entry["path"]: (entry, np.array(old.profiles[entry["offset"]:entry["offset"] + entry["n_windows"]]))
+                            for entry in old.files}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        files = []
+        parts = []
+        offset = 0
+        for audio_path in audio_paths:
+            stat = os.stat(audio_path)
+            cached = previous.get(audio_path)
+            start = time.perf_counter()
+            if cached and cached[0]["size"] == stat.st_size and cached[0]["mtime"] == stat.st_mtime:
+                profiles = cached[1]
+            else:
+                try:
+                    profiles = pitch_class_profiles(audio_path, **params).astype(np.float16)
+                except Exception as e:
+                    print(f"Skipping {audio_path}: {e}", file=sys.stderr)
+                    continue
+            if verbose:
+                print(f"{audio_path}: {len(profiles)} windows in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+            files.append({"path": audio_path, "size": stat.st_size, "mtime": stat.st_mtime,
+                          "offset": offset, "n_windows": len(profiles)})
+            parts.append(profiles)
+            offset += len(profiles)
+
+        os.makedirs(index_dir, exist_ok=True)
+        all_profiles = np.vstack(parts) if parts else np.zeros((0, 12), dtype=np.float16)
+        # Write beside the old files and swap, so a concurrent query never sees a half-written index.
+        profiles_path = os.path.join(index_dir, PROFILES_FILE)
+        table_path = os.path.join(index_dir, FILES_TABLE)
+        np.save(profiles_path + ".tmp.npy", all_profiles)
+        with open(table_path + ".tmp", 'w') as f:
+            json.dump({"version": TAKE_INDEX_VERSION, "params": params,
+                       "window_seconds": effective_window_seconds(**params), "files": files}, f, indent=4)
+        os.replace(profiles_path + ".tmp.npy", profiles_path)
+        os.replace(table_path + ".tmp", table_path)
+        return TakeIndex(index_dir)
+
+    def query(self, profile, top_k=10, per_file=False):
+        """
+        Ranks indexed windows by cosine similarity to a 12-bin pitch-class profile.
+
+        Args:
+            profile (np.ndarray): Query profile (need not be normalised).
+            top_k (int): Number of matches to return.
+            per_file (bool): Return only the best window of each take.
+        Returns:
+            list: dicts with 'score', 'path', 'start' and 'end' (seconds), best first.
+        """
+        norm = np.linalg.norm(profile)
+        if norm == 0 or len(self.profiles) == 0:
+            return []
+        query = np.asarray(profile, dtype=np.float32) / norm
+        scores = np.empty(len(self.profiles), dtype=np.float32)
+        for start in range(0, len(self.profiles), QUERY_CHUNK_ROWS):
+            chunk = self.profiles[start:start + QUERY_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+
+        if per_file:
+            # Best row of every take: sort by (take, score) and keep each take's last row.
+            order = np.lexsort((scores, self.row_file))
+            last_of_file = np.r_[self.row_file[order][1:] != self.row_file[order][:-1], True]
+            candidates = order[last_of_file]
+        else:
+            candidates = np.arange(len(scores))
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return []
+        best = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        best = best[np.argsort(-scores[best], kind='stable')]
+
+        window_seconds = self.window_seconds
+        matches = []
+        for row in best:
+            entry = self.files[self.row_file[row]]
+            start = float((row - entry["offset"]) * window_seconds)
+            matches.append({"score": float(scores[row]), "path": entry["path"],
+                            "start": start, "end": start + window_seconds})
+        return matches
+
+    def query_notes(self, note_set, top_k=10, per_file=False):
+        """Ranks windows by how closely their pitch classes match a note set such as "C,E,G"."""
+        return self.query(parse_note_set(note_set), top_k=top_k, per_file=per_file)
+
+    def query_clip(self, clip_path, top_k=10, per_file=False):
+        """Ranks windows by similarity to the overall pitch-class profile of an example clip."""
+        profiles = pitch_class_profiles(clip_path, **self.params)
+        return self.query(profiles.sum(axis=0), top_k=top_k, per_file=per_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the pitch-class content of video takes and find the takes "
+                                                 "containing a chord or sounding like an example clip.")
+    parser.add_argument("command", choices=("build", "query"),
+                        help="build: index the takes under 'path'; query: search an existing index.")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="For build: directory or glob of takes (e.g. ../SEB_BELLS_PIECE_JULY25).")
+    parser.add_argument("-i", "--index_dir", type=str, default="take_index",
+                        help="Index directory (default: take_index).")
+    parser.add_argument("--window_seconds", type=float, default=DEFAULT_INDEX_PARAMS["window_seconds"],
+                        help="Length of each indexed window in seconds (default: 2).")
+    parser.add_argument("--notes", type=str, default=None,
+                        help="Query by note set, e.g. \"C,E,G\" (octaves are ignored).")
+    parser.add_argument("--clip", type=str, default=None,
+                        help="Query by an example audio clip.")
+    parser.add_argument("-k", "--top_k", type=int, default=10,
+                        help="Number of matches to return (default: 10).")
+    parser.add_argument("--per_file", action="store_true",
+                        help="Return only the best matching window of each take.")
+    parser.add_argument("-o", "--output_json", type=str, default=None,
+                        help="Write query matches to this JSON file instead of printing them.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if not args.path:
+            parser.error("build needs the directory or glob of takes to index.")
+        audio_paths = find_audio_files(args.path, extensions=TAKE_EXTENSIONS)
+        if not audio_paths:
+            print(f"No mp4/m4a files found for '{args.path}'.", file=sys.stderr)
+            sys.exit(1)
+        index = TakeIndex.build(args.index_dir, audio_paths, window_seconds=args.window_seconds)
+        print(f"Indexed {len(index.files)} takes, {len(index.profiles)} windows, into {args.index_dir}")
+        sys.exit(0)
+
+    if bool(args.notes) == bool(args.clip):
+        parser.error("query needs exactly one of --notes or --clip.")
+    try:
+        index = TakeIndex(args.index_dir)
+    except (OSError, ValueError) as e:
+        print(f"Error opening index: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    if args.notes:
+        matches = index.query_notes(args.notes, top_k=args.top_k, per_file=args.per_file)
+    else:
+        matches = index.query_clip(args.clip, top_k=args.top_k, per_file=args.per_file)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(matches, f, indent=4)
+        print(f"{len(matches)} matches saved to {args.output_json}")
+    else:
+        print(f"{len(matches)} matches in {elapsed_ms:.1f} ms:")
+        for match in matches:
+            print(f"  {match['score']:.3f}  {match['path']}  {match['start']:.1f}-{match['end']:.1f}s")
@@ -0,0 +1,21 @@
+import numpy as np
+
+from bell_ringing_calculator import generate_method_rows, generate_named_method_rows
+
+
+def test_max_rows_caps_the_number_of_rows():
+    for max_rows in (0, 1, 2, 5, 13):
+        rows = list(generate_method_rows("x16x16x16,12", 6, stop_at_rounds=False, max_rows=max_rows))
+        assert len(rows) == max_rows
+
+
+def test_max_rows_one_yields_only_rounds():
+    rows = list(generate_named_method_rows("plain_bob_minor", max_rows=1))
+    assert len(rows) == 1
+    assert rows[0].tolist() == [1, 2, 3, 4, 5, 6]
+
+
+def test_plain_course_comes_round():
+    rows = list(generate_named_method_rows("plain_bob_minor"))
+    assert len(rows) == 61
+    assert np.array_equal(rows[0], rows[-1])